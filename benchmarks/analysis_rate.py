@@ -0,0 +1,95 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+"""
+Throughput and accuracy of the analysis sampling frequencies and resamplers.
+
+    PYTHONPATH=. python benchmarks/analysis_rate.py song.flac ReferenceAnnotations/Beatles/Let_It_Be/chords.lab [AUDIO LAB ...]
+"""
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+import soundfile
+
+from chordify.annotation import parse_annotation, make_timeline
+from chordify.app import Chordify
+from chordify.audio_processing import analysis_sampling_frequency
+from chordify.state import AppState
+from chordify.utils import score
+
+
+def run(app: Chordify, config: dict, tracks):
+    ctx = app.with_config(config)
+    ctx.push()
+    try:
+        ctx.transition_to(AppState.PREDICTING)
+
+        _elapsed = 0.0
+        _duration = 0.0
+        _scores = list()
+        for audio_path, annotation_path in tracks:
+            start = perf_counter()
+            chroma, beat_t = ctx.audio_processing.process(audio_path)
+            prediction = ctx.chord_recognition.predict(chroma)
+            _elapsed += perf_counter() - start
+            _duration += soundfile.info(str(audio_path)).duration
+            _scores.append(score(make_timeline(beat_t, prediction), parse_annotation(ctx, annotation_path)))
+
+        return analysis_sampling_frequency(ctx.config), _duration / _elapsed, sum(_scores) / len(_scores)
+    finally:
+        ctx.pop()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("pairs", nargs="+", type=Path, help="audio file followed by its .lab annotation")
+    parser.add_argument("--rates", nargs="+", default=["none", "auto", "22050"])
+    parser.add_argument("--resamplers", nargs="+", default=["default", "polyphase"],
+                        help="res_type of librosa, 'default' for its default, kaiser_* need resampy")
+    args = parser.parse_args()
+
+    if len(args.pairs) % 2 != 0:
+        parser.error("expected pairs of audio and annotation paths")
+    tracks = tuple(zip(args.pairs[::2], args.pairs[1::2]))
+
+    app = Chordify()
+    print("%-8s %-12s %8s %12s %8s" % ("rate", "resampler", "sr", "x realtime", "score"))
+    for rate in args.rates:
+        for resampler in args.resamplers:
+            sr, speed, accuracy = run(app, {
+                "CHARTS": False,
+                "CACHE_DIR": None,
+                "CACHE_MAX_BYTES": 0,
+                "ANALYSIS_SAMPLING_FREQUENCY": None if rate == "none" else rate if rate == "auto" else int(rate),
+                "RESAMPLER": None if resampler == "default" else resampler,
+            }, tracks)
+            print("%-8s %-12s %8d %12.2f %7.2f%%" % (rate, resampler, sr, speed, accuracy * 100))
+
+
+if __name__ == '__main__':
+    main()
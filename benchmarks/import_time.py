@@ -0,0 +1,91 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+"""
+Cold import time of the chordify modules in fresh interpreters, and the heavy dependencies each one loads.
+With an audio file, also the dependencies a headless template prediction ends up loading.
+
+    PYTHONPATH=. python benchmarks/import_time.py [--modules chordify.app chordify.music] [--repeat 5] [--audio song.flac]
+"""
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+# a submodule of each dependency, present in sys.modules only once the dependency really ran
+HEAVY = {
+    "librosa": "librosa.core",
+    "scipy.signal": "scipy.signal._peak_finding",
+    "soundfile": "_soundfile",
+    "numba": "numba.core",
+    "joblib": "joblib.parallel",
+    "sklearn": "sklearn.base",
+    "pandas": "pandas.core",
+    "matplotlib": "matplotlib.pyplot",
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name, marker in {heavy!r}.items() if marker in sys.modules]]))
+"""
+
+_PREDICT = """
+from chordify.app import Chordify
+with Chordify().with_config({{"CHARTS": False}}) as app:
+    app.from_path({audio!r})
+"""
+
+
+def probe(code: str):
+    out = subprocess.run([sys.executable, "-c", _PROBE.format(code=code, heavy=HEAVY)], check=True,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--modules", nargs="+", default=["chordify.music", "chordify.audio_processing",
+                                                         "chordify.learn", "chordify.display", "chordify.app"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--audio", help="also profile a headless prediction of this file")
+    args = parser.parse_args()
+
+    print("%-28s %10s  %s" % ("module", "import ms", "heavy dependencies loaded"))
+    for module in args.modules:
+        runs = [probe("import " + module) for _ in range(args.repeat)]
+        print("%-28s %10.1f  %s" % (module, min(r[0] for r in runs) * 1000, ", ".join(runs[0][1]) or "-"))
+
+    if args.audio is not None:
+        elapsed, loaded = probe(_PREDICT.format(audio=args.audio))
+        print("%-28s %10.1f  %s" % ("headless prediction", elapsed * 1000, ", ".join(loaded) or "-"))
+
+
+if __name__ == '__main__':
+    main()
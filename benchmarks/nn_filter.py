@@ -0,0 +1,100 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+"""
+Runtime, peak memory and agreement of the local nearest neighbour filter with librosa.decompose.nn_filter.
+
+    PYTHONPATH=. python benchmarks/nn_filter.py [--frames 2000 8000 20000] [--window 64] [--k K] [--audio song.flac]
+"""
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+import librosa
+import numpy as np
+
+from chordify.audio_processing import local_nn_filter, PathLoadStrategy, CQTStrategy
+from chordify.chord_recognition import TemplatePredictStrategy
+from chordify.music import TemplateChords
+
+
+def measure(func, *args, **kwargs):
+    tracemalloc.start()
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def synthetic_chroma(n_frames: int, seed: int = 0) -> np.ndarray:
+    """ Chords held for 5-40 frames, with noise """
+    rng = np.random.default_rng(seed)
+    templates = np.array([tuple(chord.vector) for chord in TemplateChords.ALL], dtype=np.float32)
+    columns = list()
+    while sum(c.shape[1] for c in columns) < n_frames:
+        length = int(rng.integers(5, 40))
+        columns.append(np.repeat(templates[rng.integers(len(templates))][:, None], length, axis=1))
+    chroma = np.concatenate(columns, axis=1)[:, :n_frames]
+    return librosa.util.normalize(chroma + 0.3 * rng.random(chroma.shape, dtype=np.float32), axis=0)
+
+
+def audio_chroma(path: Path) -> np.ndarray:
+    c = CQTStrategy(44100, 4096, 440, 84, 36).run(PathLoadStrategy(44100).run(path))
+    return librosa.feature.chroma_cqt(C=c, hop_length=4096, fmin=440, bins_per_octave=36, n_octaves=7)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", nargs="+", type=int, default=[2000, 8000, 20000])
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--k", type=int, default=None)
+    parser.add_argument("--audio", type=Path, default=None)
+    args = parser.parse_args()
+
+    inputs = [("audio", audio_chroma(args.audio))] if args.audio else \
+        [("%d frames" % n, synthetic_chroma(n)) for n in args.frames]
+    recognizer = TemplatePredictStrategy()
+
+    print("%-14s %-8s %10s %12s %10s %10s" % ("input", "filter", "time (s)", "peak (MiB)", "max diff", "agreement"))
+    for name, chroma in inputs:
+        full, t_full, m_full = measure(librosa.decompose.nn_filter, chroma, aggregate=np.median, metric='cosine')
+        local, t_local, m_local = measure(local_nn_filter, chroma, args.window, args.k)
+
+        p_full = recognizer.predict(np.minimum(chroma, full))
+        p_local = recognizer.predict(np.minimum(chroma, local))
+        agreement = np.mean([a == b for a, b in zip(p_full, p_local)])
+
+        print("%-14s %-8s %10.3f %12.1f %10s %10s" % (name, "full", t_full, m_full / 2 ** 20, "", ""))
+        print("%-14s %-8s %10.3f %12.1f %10.3f %9.1f%%" % (name, "local", t_local, m_local / 2 ** 20,
+                                                          np.abs(full - local).max(), agreement * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+"""
+Wall time of template recognition over growing chord vocabularies, best chord and top-k candidates per frame.
+
+    PYTHONPATH=. python benchmarks/vocabulary.py [--frames 20000] [--k 5] [--repeat 20]
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+
+from chordify.chord_recognition import TemplatePredictStrategy, VocabularyPredictStrategy
+from chordify.vocabulary import VOCABULARIES
+
+
+def timed(func, repeat: int) -> float:
+    func()
+    start = perf_counter()
+    for _ in range(repeat):
+        func()
+    return (perf_counter() - start) / repeat
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    chroma = np.random.default_rng(0).random((12, args.frames), dtype=np.float32)
+
+    print("%-24s %8s %12s %12s" % ("recognizer", "chords", "best ms", "top-k ms"))
+    template = TemplatePredictStrategy()
+    print("%-24s %8d %12.2f %12s" % ("template", len(template.chords),
+                                     timed(lambda: template.predict_ids(chroma), args.repeat) * 1000, "-"))
+    for name in VOCABULARIES:
+        strategy = VocabularyPredictStrategy(name)
+        print("%-24s %8d %12.2f %12.2f" % (
+            "vocabulary " + name, len(strategy.chords),
+            timed(lambda: strategy.predict_ids(chroma), args.repeat) * 1000,
+            timed(lambda: strategy.top_k(chroma, args.k), args.repeat) * 1000))
+
+
+if __name__ == '__main__':
+    main()
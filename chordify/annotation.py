@@ -37,20 +37,21 @@
 #
 from abc import abstractmethod
 from pathlib import Path
-from typing import Tuple, List, Sequence
+from typing import Tuple, List, Sequence, Union
 
-from pandas import read_csv
+import numpy as np
 
 from .ctx import _chord_resolution
 from .exceptions import IllegalArgumentError
-from .music import IChord, ChordKey
+from .music import IChord, NO_CHORD_ID, CHORD_ID_DTYPE, chord_from_id, label_to_id, labels_to_ids, ids_to_chords
 from .strategy import Strategy
 
 
 class ChordTimeline(Sequence):
+    """ Chords are stored as integer ids, see chordify.music.CHORDS """
     _start: List[float]
     _stop: List[float]
-    _chords: List[IChord]
+    _ids: List[int]
     _len: int = 0
     _counter: int = 0
 
@@ -58,7 +59,7 @@ class ChordTimeline(Sequence):
         super().__init__()
         self._start = list()
         self._stop = list()
-        self._chords = list()
+        self._ids = list()
 
     def __iter__(self):
         self._counter = 0
@@ -67,29 +68,53 @@ class ChordTimeline(Sequence):
     def __next__(self) -> Tuple[float, float, IChord]:
         if self._counter < self._len:
             self._counter += 1
-            return self._start[self._counter - 1], self._stop[self._counter - 1], self._chords[self._counter - 1]
+            return self._start[self._counter - 1], self._stop[self._counter - 1], chord_from_id(
+                self._ids[self._counter - 1])
         else:
             raise StopIteration
 
     def __getitem__(self, item) -> Tuple[float, float, IChord]:
-        return self._start[item], self._stop[item], self._chords[item]
+        if isinstance(item, slice):
+            return self._start[item], self._stop[item], list(ids_to_chords(self._ids[item]))
+        return self._start[item], self._stop[item], chord_from_id(self._ids[item])
 
     def __len__(self) -> int:
         return self._len
 
     def append(self, start: float, stop: float, chord: IChord):
-        if start is None or stop is None or start < 0 or stop <= 0 or chord is None:
+        if chord is None:
             raise IllegalArgumentError
+        self.append_id(start, stop, chord.id)
 
-        if len(self._start) > 0 and max(self._start) > start:
+    def append_id(self, start: float, stop: float, chord_id: int):
+        if start is None or stop is None or start < 0 or stop <= 0 or chord_id is None:
             raise IllegalArgumentError
-        if len(self._stop) > 0 and max(self._stop) > stop:
+
+        # starts and stops are kept non-decreasing, so the last one is the maximum
+        if self._len > 0 and (self._start[-1] > start or self._stop[-1] > stop):
             raise IllegalArgumentError
         self._start.append(float(start))
         self._stop.append(float(stop))
-        self._chords.append(chord)
+        self._ids.append(int(chord_id))
         self._len += 1
 
+    def extend(self, start: np.ndarray, stop: np.ndarray, chord_ids: np.ndarray):
+        start = np.asarray(start, dtype=float)
+        stop = np.asarray(stop, dtype=float)
+        chord_ids = np.asarray(chord_ids)
+        if not len(start) == len(stop) == len(chord_ids):
+            raise IllegalArgumentError
+        if len(start) == 0:
+            return
+        if np.any(start < 0) or np.any(stop <= 0) or np.any(np.diff(start) < 0) or np.any(np.diff(stop) < 0):
+            raise IllegalArgumentError
+        if self._len > 0 and (self._start[-1] > start[0] or self._stop[-1] > stop[0]):
+            raise IllegalArgumentError
+        self._start.extend(start.tolist())
+        self._stop.extend(stop.tolist())
+        self._ids.extend(chord_ids.tolist())
+        self._len += len(start)
+
     def start(self) -> Tuple[float, ...]:
         return tuple(self._start)
 
@@ -97,7 +122,10 @@ class ChordTimeline(Sequence):
         return tuple(self._stop)
 
     def chords(self) -> Tuple[IChord, ...]:
-        return tuple(self._chords)
+        return ids_to_chords(self._ids)
+
+    def chord_ids(self) -> np.ndarray:
+        return np.array(self._ids, dtype=CHORD_ID_DTYPE)
 
     def duration(self) -> float:
         return self._stop[-1]
@@ -127,13 +155,13 @@ class LabParser(AnnotationParser):
 
     def parse(self, absolute_path) -> ChordTimeline:
         assert self.__class__.accept(absolute_path)
+        from pandas import read_csv
 
         csv = read_csv(filepath_or_buffer=absolute_path, header=None, skip_blank_lines=True, delimiter=" ")
 
         _timeline = ChordTimeline()
-        for i, row in csv.iterrows():
-            start, stop, chord = row
-            _timeline.append(float(start), float(stop), parse_chord(str(chord)))
+        _timeline.extend(csv[0].to_numpy(dtype=float), csv[1].to_numpy(dtype=float),
+                         parse_chord_ids(csv[2].astype(str)))
 
         return _timeline
 
@@ -150,19 +178,27 @@ def parse_annotation(config, annotation_path: Path) -> ChordTimeline:
 
 
 def parse_chord(chord_label: str) -> IChord:
-    for i_chord in reversed(_chord_resolution()):
-        if chord_label == str(i_chord.__repr__()):
-            return i_chord
-    return IChord(ChordKey.N, None)
+    chord = chord_from_id(label_to_id(chord_label))
+    if chord in _chord_resolution():
+        return chord
+    return chord_from_id(NO_CHORD_ID)
 
 
-def make_timeline(beat_time: Sequence[float], annotation: Sequence[IChord]) -> ChordTimeline:
-    start = 0.0
-    _timeline = ChordTimeline()
-    for stop, chord in zip(beat_time[1:], annotation):
-        _timeline.append(start, stop, chord)
-        start = stop
+def parse_chord_ids(chord_labels: Sequence[str]) -> np.ndarray:
+    """ Ids of labels, chords outside of the current resolution are no chord """
+    _ids = labels_to_ids(chord_labels)
+    _ids[~np.isin(_ids, _chord_resolution().ids())] = NO_CHORD_ID
+    return _ids
+
 
+def make_timeline(beat_time: Sequence[float], annotation: Union[np.ndarray, Sequence[IChord]]) -> ChordTimeline:
+    if not isinstance(annotation, np.ndarray):
+        annotation = np.fromiter((chord.id for chord in annotation), dtype=CHORD_ID_DTYPE)
+    beat_time = np.asarray(beat_time, dtype=float)
+    n = min(len(annotation), max(len(beat_time) - 1, 0))
+
+    _timeline = ChordTimeline()
+    _timeline.extend(np.concatenate(([0.0], beat_time[1:n + 1]))[:n], beat_time[1:n + 1], annotation[:n])
     return _timeline
 
 
@@ -36,19 +36,24 @@
 #
 #
 #
-from typing import Iterator, Union
-
-from joblib import Parallel, delayed
+from collections import defaultdict, deque
+from concurrent.futures import BrokenExecutor
+from typing import AsyncIterator, Dict, Iterable, Iterator, Tuple, Union
 
 from chordify.exceptions import IllegalConfigError
 from .annotation import parse_annotation, make_timeline
 from .audio_processing import *
+from .cache import file_digest
+from .checkpoint import CheckpointStore
 from .chord_recognition import *
 from .config import Config, ImmutableDict
 from .ctx import Context, _ctx_stack, ContextAttribute, ConfigAttribute
 from .display import Plotter
-from .learn import SupervisedVectors, SVCLearn
-from .music import Vector
+from .executor import ExtractionExecutor
+from .result import RecognitionResult
+from .learn import SupervisedVectors, SVCLearn, OnlineLearnStrategy
+from .model import ModelRegistry
+from .music import Vector, chord_from_id, ids_to_chords
 from .state import AppState
 
 
@@ -69,6 +74,30 @@ def check_config(config):
         raise IllegalConfigError
     if "CHORD_LEARNING_CLASS" in config and not issubclass(config["CHORD_LEARNING_CLASS"], Strategy):
         raise IllegalConfigError
+    if "VITERBI_SCORE_CLASS" in config and not issubclass(config["VITERBI_SCORE_CLASS"], Strategy):
+        raise IllegalConfigError
+    if "DTYPE" in config and config["DTYPE"] is not None and np.dtype(config["DTYPE"]).kind != "f":
+        raise IllegalConfigError
+    if "LEARN_BATCH_SIZE" in config and config["LEARN_BATCH_SIZE"] < 1:
+        raise IllegalConfigError
+    if "N_JOBS" in config and config["N_JOBS"] == 0:
+        raise IllegalConfigError
+    if "EXTRACTION_CHUNK_SIZE" in config and config["EXTRACTION_CHUNK_SIZE"] < 1:
+        raise IllegalConfigError
+    if "CHECKPOINT_SHARD_SIZE" in config and config["CHECKPOINT_SHARD_SIZE"] < 1:
+        raise IllegalConfigError
+    if "NN_WINDOW" in config and config["NN_WINDOW"] < 1:
+        raise IllegalConfigError
+    if "NN_K" in config and config["NN_K"] is not None and config["NN_K"] < 1:
+        raise IllegalConfigError
+    if "SVC_SEARCH" in config and config["SVC_SEARCH"] not in ("grid", "halving"):
+        raise IllegalConfigError
+    if "SVC_HALVING_FACTOR" in config and config["SVC_HALVING_FACTOR"] < 2:
+        raise IllegalConfigError
+    if "SVC_MAX_RESOURCES" in config and config["SVC_MAX_RESOURCES"] < 1:
+        raise IllegalConfigError
+    if "CPU_BUDGET" in config and config["CPU_BUDGET"] == 0:
+        raise IllegalConfigError
 
 
 class Chordify(object):
@@ -91,14 +120,47 @@ class Chordify(object):
         "AP_BEAT_STRATEGY_CLASS": BeatSegmentationStrategy,
 
         "SAMPLING_FREQUENCY": 44100,
+        "ANALYSIS_SAMPLING_FREQUENCY": None,
+        "RESAMPLER": None,
         "N_OCTAVES": 84 // 12,
         "N_BINS": 84,
         "BINS_PER_OCTAVE": 12 * 3,
         "MIN_FREQ": 440,
         "HOP_LENGTH": 4096,
+        "BLOCK_LENGTH": 256,
+        "BLOCK_MARGIN": 4,
+        "STREAM_LATENCY": 1.0,
+        "HCDF_WINDOW": 64,
+        "NN_WINDOW": 64,
+        "NN_K": None,
+        "DTYPE": None,
+
+        "N_JOBS": -3,
+        "EXTRACTION_CHUNK_SIZE": 4,
+
+        "CHECKPOINT_DIR": None,
+        "CHECKPOINT_SHARD_SIZE": 256,
+
+        "CACHE_DIR": None,
+        "CACHE_MAX_BYTES": 256 * 1024 * 1024,
 
         "CHORD_RECOGNITION_CLASS": TemplatePredictStrategy,
         "CHORD_LEARNING_CLASS": SVCLearn,
+        "MODEL_PATH": "model.pickle",
+        "SVC_SEARCH": "grid",
+        "SVC_PARAM_GRID": None,
+        "SVC_HALVING_FACTOR": 3,
+        "SVC_MAX_RESOURCES": 5000,
+        "CPU_BUDGET": None,
+        "LEARN_BATCH_SIZE": 256,
+        "ONLINE_WARM_START": None,
+
+        "VOCABULARY": "sevenths",
+        "VOCABULARY_HARMONICS": False,
+
+        "VITERBI_SCORE_CLASS": TemplatePredictStrategy,
+        "VITERBI_SELF_TRANSITION": 0.8,
+        "VITERBI_TEMPERATURE": 0.05,
     })
 
     debug = ConfigAttribute("DEBUG")
@@ -158,6 +220,107 @@ class Chordify(object):
             log(self.__class__, "Stop predicting")
             ctx.pop()
 
+    def recognize(self, absolute_path: Union[Path, str]) -> RecognitionResult:
+        """ Like from_path without charts, returns the chord ids together with the scores of every chord and the
+        segment times """
+        log(self.__class__, "Start recognizing")
+        ctx = self.app_context()
+        try:
+            ctx.push()
+            ctx.transition_to(AppState.PREDICTING)
+
+            _absolute_path = Path(absolute_path) if isinstance(absolute_path, str) else absolute_path
+            chroma_sync, beat_t = self.audio_processing.process(_absolute_path)
+            return self.chord_recognition.recognize(chroma_sync, beat_t)
+        finally:
+            log(self.__class__, "Stop recognizing")
+            ctx.pop()
+
+    def from_paths(self, paths: Iterable[Union[Path, str]], n_jobs: int = None, prefetch: int = 2) \
+            -> Iterator[Tuple[Path, Tuple[IChord, ...]]]:
+        """ Recognizes chords of many files, yields (path, prediction) in completion order. Files are analysed on
+        `n_jobs` processes, N_JOBS of the config by default, while the next ones are read ahead, chroma of the tracks
+        finished together is recognized in one call. """
+        log(self.__class__, "Start predicting paths")
+        ctx = self.app_context()
+        try:
+            ctx.push()
+            ctx.transition_to(AppState.PREDICTING)
+
+            with ExtractionExecutor(ctx.config, ctx.config["N_JOBS"] if n_jobs is None else n_jobs, prefetch,
+                                    self.audio_processing, ctx.config["EXTRACTION_CHUNK_SIZE"]) as executor:
+                for batch in executor.completed(paths):
+                    _paths = [path for path, _ in batch]
+                    _chroma = [future.result()[0] for _, future in batch]
+                    for path, ids in zip(_paths, self.chord_recognition.predict_ids_batch(_chroma)):
+                        yield path, ids_to_chords(ids)
+        finally:
+            log(self.__class__, "Stop predicting paths")
+            ctx.pop()
+
+    def _stream_events(self, stream: StreamProcessing, segments: Iterator[Tuple[np.ndarray, np.ndarray]]) \
+            -> Iterator[Tuple[float, float, IChord]]:
+        for vectors, boundaries in segments:
+            prediction = self.chord_recognition.predict_ids(vectors)
+
+            # runs of equal chord ids are merged into one event
+            changes = np.flatnonzero(np.diff(prediction)) + 1
+            starts = np.concatenate(([0], changes))
+            stops = np.concatenate((changes, [len(prediction)]))
+            for start, stop in zip(starts[:len(prediction)], stops):
+                yield stream.frame_time(boundaries[start]), stream.frame_time(boundaries[stop]), chord_from_id(
+                    prediction[start])
+
+    @staticmethod
+    def _stream_segments(stream: StreamProcessing, segmenter: FrameSegmenter, block: np.ndarray = None) \
+            -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        for frame, chroma in stream.push(block) if block is not None else stream.flush():
+            yield from segmenter.push(frame, chroma)
+        if block is None:
+            yield from segmenter.flush()
+
+    def _from_stream(self, blocks: Iterable[np.ndarray]) -> Iterator[Tuple[float, float, IChord]]:
+        log(self.__class__, "Start streaming")
+        ctx = self.app_context()
+        try:
+            ctx.push()
+            ctx.transition_to(AppState.PREDICTING)
+
+            stream = StreamProcessing.factory(ctx.config)
+            segmenter = self.audio_processing.beat_strategy.segmenter()
+            for block in blocks:
+                yield from self._stream_events(stream, self._stream_segments(stream, segmenter, block))
+            yield from self._stream_events(stream, self._stream_segments(stream, segmenter))
+        finally:
+            log(self.__class__, "Stop streaming")
+            ctx.pop()
+
+    async def _from_async_stream(self, blocks: AsyncIterator[np.ndarray]) -> AsyncIterator[Tuple[float, float, IChord]]:
+        log(self.__class__, "Start streaming")
+        ctx = self.app_context()
+        try:
+            ctx.push()
+            ctx.transition_to(AppState.PREDICTING)
+
+            stream = StreamProcessing.factory(ctx.config)
+            segmenter = self.audio_processing.beat_strategy.segmenter()
+            async for block in blocks:
+                for event in self._stream_events(stream, self._stream_segments(stream, segmenter, block)):
+                    yield event
+            for event in self._stream_events(stream, self._stream_segments(stream, segmenter)):
+                yield event
+        finally:
+            log(self.__class__, "Stop streaming")
+            ctx.pop()
+
+    def from_stream(self, blocks: Union[Iterable[np.ndarray], AsyncIterator[np.ndarray]]):
+        """ Recognizes chords in a stream of PCM blocks sampled at SAMPLING_FREQUENCY. Yields (start, stop, chord)
+        events, each at most STREAM_LATENCY plus BLOCK_MARGIN hops after its audio arrived (plus HCDF_WINDOW / 2
+        hops with HCDF segmentation). Returns an async iterator when given an async iterator. """
+        if hasattr(blocks, "__aiter__"):
+            return self._from_async_stream(blocks)
+        return self._from_stream(blocks)
+
     def from_samples(self, paths: Iterator[Path] = None, labels: Iterator[IChord] = None,
                      iterable: Iterator = None):
         log(self.__class__, "Start learning")
@@ -169,15 +332,59 @@ class Chordify(object):
             if iterable is None and (paths is None or labels is None):
                 raise IllegalArgumentError
 
-            _iter = tuple(zip(paths, labels) if iterable is None else iterable)
+            # finished files are taken from the checkpoint store, failures are recorded there instead of raised
+            _store = CheckpointStore(ctx.config["CHECKPOINT_DIR"], self.audio_processing.pipeline_key(),
+                                     ctx.config["CHECKPOINT_SHARD_SIZE"]) if ctx.config["CHECKPOINT_DIR"] else None
+            _labels: Dict[Path, deque] = defaultdict(deque)
+
+            # an online learner takes the vectors in mini-batches as they are extracted, others get all of them
+            _online = isinstance(self.chord_learner, OnlineLearnStrategy)
+            _batch_size = ctx.config["LEARN_BATCH_SIZE"]
             _supervised_vectors = SupervisedVectors()
 
-            with Parallel(n_jobs=-3) as parallel:
-                out = parallel(delayed(self.audio_processing.process)(path) for path, label in _iter)
-                for vector_beat, path_label in zip(out, _iter):
-                    _supervised_vectors.append(Vector(vector_beat[0]), path_label[1])
+            def learn(vector: np.ndarray, label: IChord):
+                nonlocal _supervised_vectors
+                _supervised_vectors.append(Vector(vector), label)
+                if _online and len(_supervised_vectors) >= _batch_size:
+                    self.chord_learner.partial_learn(*_supervised_vectors.arrays())
+                    _supervised_vectors = SupervisedVectors()
+
+            def digest(path: Path):
+                try:
+                    return file_digest(path)
+                except OSError:
+                    return None
+
+            def pending_paths():
+                for path, label in zip(paths, labels) if iterable is None else iterable:
+                    _path = Path(path)
+                    if _store is not None and digest(_path) in _store:
+                        learn(_store.get(digest(_path)), label)
+                        continue
+                    _labels[_path].append(label)
+                    yield _path
+
+            try:
+                with ExtractionExecutor(ctx.config, ctx.config["N_JOBS"], audio_processing=self.audio_processing,
+                                        chunksize=ctx.config["EXTRACTION_CHUNK_SIZE"]) as executor:
+                    for batch in executor.completed(pending_paths()):
+                        for path, future in batch:
+                            label = _labels[path].popleft()
+                            if _store is None:
+                                learn(future.result()[0], label)
+                            elif future.exception() is None:
+                                _store.put(digest(path), path, future.result()[0])
+                                learn(future.result()[0], label)
+                            elif isinstance(future.exception(), BrokenExecutor):
+                                raise future.exception()
+                            else:
+                                _store.fail(digest(path), path, future.exception())
+            finally:
+                if _store is not None:
+                    _store.close()
 
             self.chord_learner.learn(_supervised_vectors)
+            ModelRegistry.instance().reload(ctx.config["MODEL_PATH"], ctx.config)
         finally:
             log(self.__class__, "Stop learning")
             ctx.pop()
@@ -37,79 +37,334 @@
 #
 #
 from abc import abstractmethod, ABC
-from functools import lru_cache
+from collections import ChainMap
+from math import ceil, floor
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator, Tuple
 
-import librosa
 import numpy as np
 
 from chordify.logger import log
+from .cache import FeatureCache, NoCache, file_digest, file_stat_key, make_key, make_cache, strategy_key
 from .exceptions import IllegalArgumentError
-from .hcdf import get_segments
+from .hcdf import get_segments, IncrementalHCDF
+from .lazy import lazy_import
 from .strategy import Strategy
 
+librosa = lazy_import("librosa")
+ndimage = lazy_import("scipy.ndimage")
+soundfile = lazy_import("soundfile")
+
+# equivalent noise bandwidth of the hann window of the CQT filters, and the share of the band below Nyquist
+# which the resamplers keep clean
+_HANN_BANDWIDTH = 1.50018
+_RESAMPLER_PASSBAND = 0.9
+
+
+def _lowest_sampling_frequency(config) -> int:
+    sr = config["SAMPLING_FREQUENCY"]
+    hop_length = config["HOP_LENGTH"]
+    n_octaves = int(ceil(config["N_BINS"] / config["BINS_PER_OCTAVE"]))
+
+    f_max = config["MIN_FREQ"] * 2 ** ((config["N_BINS"] - 1) / config["BINS_PER_OCTAVE"])
+    q = 1 / (2 ** (1 / config["BINS_PER_OCTAVE"]) - 1)
+    f_cutoff = f_max * (1 + 0.5 * _HANN_BANDWIDTH / q)
+
+    factor = 1
+    while sr % (2 * factor) == 0 \
+            and hop_length % (2 * factor * 2 ** (n_octaves - 1)) == 0 \
+            and sr / (4 * factor) * _RESAMPLER_PASSBAND >= f_cutoff:
+        factor *= 2
+    return sr // factor
+
+
+def resampler_kwargs(res_type: str = None) -> dict:
+    """ Resampler argument of librosa, None keeps the default of the installed librosa """
+    return {} if res_type is None else {"res_type": res_type}
+
+
+def analysis_sampling_frequency(config) -> int:
+    """ Rate the pipeline runs at, "auto" picks the lowest one which still holds the whole CQT range """
+    sr = config["ANALYSIS_SAMPLING_FREQUENCY"]
+    if sr is None:
+        return config["SAMPLING_FREQUENCY"]
+    if sr == "auto":
+        return _lowest_sampling_frequency(config)
+    return int(sr)
+
+
+def analysis_hop_length(config) -> int:
+    """ HOP_LENGTH is given at SAMPLING_FREQUENCY, frames keep their duration at the analysis rate """
+    return config["HOP_LENGTH"] * analysis_sampling_frequency(config) // config["SAMPLING_FREQUENCY"]
+
+
+def analysis_n_fft(config) -> int:
+    return 2048 * analysis_sampling_frequency(config) // config["SAMPLING_FREQUENCY"]
+
+
+def pipeline_dtype(config) -> str:
+    """ Name of the floating point type the features are kept in, None leaves them as librosa returns them """
+    dtype = config["DTYPE"]
+    if dtype is None:
+        return None
+    dtype = np.dtype(dtype)
+    if dtype.kind != "f":
+        raise IllegalArgumentError
+    return dtype.name
+
+
+def cast(value: Any, dtype: str) -> Any:
+    """ Real arrays become `dtype` and complex ones its complex counterpart, tuples are cast item by item. Arrays
+    already of the type are returned as they are. """
+    if dtype is None:
+        return value
+    if isinstance(value, tuple):
+        return tuple(cast(v, dtype) for v in value)
+    if not isinstance(value, np.ndarray) or value.dtype.kind not in "fc":
+        return value
+    if value.dtype.kind == "c":
+        return value.astype(np.promote_types(dtype, np.complex64), copy=False)
+    return value.astype(dtype, copy=False)
+
+
+class AnalysisContext(object):
+    """ Intermediates of one track shared between the strategies. Entries are keyed by name and the parameters
+    they were computed with, so each of them is computed at most once per track. `key` identifies the version of
+    the file they were computed from. """
+
+    def __init__(self, absolute_path: Path = None, key: Tuple = None) -> None:
+        super().__init__()
+
+        self.absolute_path = absolute_path
+        self.key = key
+        self._memo = dict()
+
+    def __contains__(self, key: Tuple) -> bool:
+        return key in self._memo
+
+    def get(self, key: Tuple, default=None) -> Any:
+        return self._memo.get(key, default)
+
+    def memoize(self, key: Tuple, func, *args) -> Any:
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = func(*args)
+            return value
+
+
+def hpss(s: np.ndarray, margin: float = 1.0, kernel_size: int = 31) -> Tuple[np.ndarray, np.ndarray]:
+    """ Harmonic and percussive parts of a spectrogram, as librosa.decompose.hpss computes them. Importing
+    librosa.decompose loads scikit-learn and pandas, the median filters and soft masks need neither. """
+    if margin < 1:
+        raise IllegalArgumentError("Margin must be >= 1")
+    phase = 1
+    if np.iscomplexobj(s):
+        s, phase = librosa.magphase(s)
+
+    harm = np.empty_like(s)
+    harm[:] = ndimage.median_filter(s, size=[1] * (s.ndim - 1) + [kernel_size], mode="reflect")
+    perc = np.empty_like(s)
+    perc[:] = ndimage.median_filter(s, size=[1] * (s.ndim - 2) + [kernel_size, 1], mode="reflect")
+
+    split_zeros = margin == 1
+    mask_harm = librosa.util.softmask(harm, perc * margin, power=2.0, split_zeros=split_zeros)
+    mask_perc = librosa.util.softmask(perc, harm * margin, power=2.0, split_zeros=split_zeros)
+    return (s * mask_harm) * phase, (s * mask_perc) * phase
+
+
+def _harmonic_stft(y: np.ndarray, n_fft: int) -> np.ndarray:
+    return hpss(librosa.stft(y, n_fft=n_fft), margin=8)[0]
+
 
 class LoadStrategy(Strategy, ABC):
 
     @abstractmethod
-    def run(self, absolute_path: Path) -> np.ndarray:
+    def run(self, absolute_path: Path, analysis: AnalysisContext = None) -> np.ndarray:
         pass
 
 
 class ExtractionStrategy(Strategy, ABC):
 
     @abstractmethod
-    def run(self, y: np.ndarray) -> np.ndarray:
+    def run(self, y: np.ndarray, analysis: AnalysisContext = None) -> np.ndarray:
         pass
 
 
 class FrameStrategy(Strategy, ABC):
 
     @abstractmethod
-    def run(self, c: np.ndarray) -> np.ndarray:
+    def run(self, c: np.ndarray, analysis: AnalysisContext = None) -> np.ndarray:
         pass
 
 
+class FrameSegmenter(object):
+    """ Segments a stream of chroma chunks, yields (segment vectors, boundary frames) as segments complete.
+    This one makes every frame a segment of its own. """
+
+    def push(self, frame: int, chroma: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        yield chroma, frame + np.arange(chroma.shape[1] + 1)
+
+    def flush(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        return iter(())
+
+
 class SegmentationStrategy(Strategy, ABC):
 
     @abstractmethod
-    def run(self, y: np.ndarray, chroma: np.ndarray) -> (np.ndarray, Any):
+    def run(self, y: np.ndarray, chroma: np.ndarray, analysis: AnalysisContext = None) -> (np.ndarray, Any):
+        """ (12, segments) vectors with the segments + 1 boundaries in seconds, from 0 to the end of the track """
         pass
 
+    def segmenter(self) -> FrameSegmenter:
+        return FrameSegmenter()
+
 
 class PathLoadStrategy(LoadStrategy):
 
     @classmethod
     def factory(cls, config, *args, **kwargs):
         log(cls, "Init")
-        return PathLoadStrategy(config["SAMPLING_FREQUENCY"])
+        return PathLoadStrategy(analysis_sampling_frequency(config),
+                                analysis_n_fft(config),
+                                config["RESAMPLER"])
 
-    def __init__(self, sampling_frequency: int):
+    def __init__(self, sampling_frequency: int, n_fft: int = 2048, res_type: str = None):
         super().__init__()
 
         self._sr = sampling_frequency
+        self._n_fft = n_fft
+        self._res_type = res_type
 
-    @lru_cache(maxsize=None)
-    def run(self, absolute_path: Path) -> np.ndarray:
-        y, sr = librosa.load(absolute_path, self._sr)
-        y_harm = librosa.effects.harmonic(y=y, margin=8)
+    def run(self, absolute_path: Path, analysis: AnalysisContext = None) -> np.ndarray:
+        analysis = analysis or AnalysisContext(absolute_path)
+
+        y = analysis.memoize(("y", self._sr, self._res_type),
+                             lambda: librosa.load(absolute_path, sr=self._sr, **resampler_kwargs(self._res_type))[0])
+        stft_harm = analysis.memoize(("harmonic_stft", self._sr, self._n_fft), _harmonic_stft, y, self._n_fft)
+        y_harm = analysis.memoize(("harmonic", self._sr, self._n_fft),
+                                  lambda: librosa.istft(stft_harm, dtype=y.dtype, length=len(y)))
         return y_harm
 
 
+class AudioBlocks(Iterable):
+    """ Harmonic signal of a file, read in blocks of `block_frames` hops with `margin_frames` hops of context on
+    both sides. Only one block is held in memory at a time. """
+
+    def __init__(self, absolute_path: Path, sampling_frequency: int, hop_length: int, block_frames: int,
+                 margin_frames: int, n_fft: int = 2048, res_type: str = None) -> None:
+        super().__init__()
+
+        if block_frames <= 0 or margin_frames < 0:
+            raise IllegalArgumentError
+
+        self.absolute_path = absolute_path
+        self.sr = sampling_frequency
+        self.hop_length = hop_length
+        self.block_frames = block_frames
+        self.margin_frames = margin_frames
+        self._n_fft = n_fft
+        self._res_type = res_type
+        self._onset_envelope = None
+
+        with soundfile.SoundFile(str(absolute_path)) as f:
+            self._native_sr = f.samplerate
+            self.length = int(ceil(f.frames * self.sr / self._native_sr))
+
+    @property
+    def n_frames(self) -> int:
+        return 1 + self.length // self.hop_length
+
+    @property
+    def block_length(self) -> int:
+        return self.block_frames * self.hop_length
+
+    @property
+    def margin(self) -> int:
+        return self.margin_frames * self.hop_length
+
+    def __len__(self):
+        return int(ceil(self.n_frames / self.block_frames))
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        with soundfile.SoundFile(str(self.absolute_path)) as f:
+            for i in range(len(self)):
+                t0 = i * self.block_length - self.margin
+                t1 = t0 + self.block_length + 2 * self.margin
+                n0 = floor(t0 * self._native_sr / self.sr)
+                n1 = ceil(t1 * self._native_sr / self.sr)
+
+                f.seek(max(n0, 0))
+                y = np.mean(f.read(n1 - max(n0, 0), dtype='float32', always_2d=True), axis=1)
+                y = np.pad(y, (max(-n0, 0), max(n1 - n0 - max(-n0, 0) - len(y), 0)))
+                if self._native_sr != self.sr:
+                    y = librosa.resample(y, orig_sr=self._native_sr, target_sr=self.sr,
+                                         **resampler_kwargs(self._res_type))
+                y = librosa.util.fix_length(y, size=t1 - t0)
+
+                yield librosa.effects.harmonic(y=y, margin=8, n_fft=self._n_fft)
+
+    def trim(self, frames: np.ndarray) -> np.ndarray:
+        """ Drops the frames computed over the margins of a block """
+        return frames[..., self.margin_frames:self.margin_frames + self.block_frames]
+
+    @property
+    def onset_envelope(self) -> np.ndarray:
+        if self._onset_envelope is None:
+            self._onset_envelope = np.concatenate(tuple(self.trim(self.onset_strength(block)) for block in self))
+        return self._onset_envelope[:self.n_frames]
+
+    @onset_envelope.setter
+    def onset_envelope(self, onset_envelope: np.ndarray):
+        self._onset_envelope = onset_envelope
+
+    def onset_strength(self, block: np.ndarray) -> np.ndarray:
+        return librosa.onset.onset_strength(y=block, sr=self.sr, hop_length=self.hop_length, n_fft=self._n_fft,
+                                            aggregate=np.median)
+
+
+class BlockLoadStrategy(LoadStrategy):
+
+    @classmethod
+    def factory(cls, config, *args, **kwargs):
+        log(cls, "Init")
+        return BlockLoadStrategy(analysis_sampling_frequency(config),
+                                 analysis_hop_length(config),
+                                 config["BLOCK_LENGTH"],
+                                 config["BLOCK_MARGIN"],
+                                 analysis_n_fft(config),
+                                 config["RESAMPLER"])
+
+    def __init__(self, sampling_frequency: int, hop_length: int, block_frames: int, margin_frames: int,
+                 n_fft: int = 2048, res_type: str = None):
+        super().__init__()
+
+        self._sr = sampling_frequency
+        self._hop_length = hop_length
+        self._block_frames = block_frames
+        self._margin_frames = margin_frames
+        self._n_fft = n_fft
+        self._res_type = res_type
+
+    def run(self, absolute_path: Path, analysis: AnalysisContext = None) -> AudioBlocks:
+        return AudioBlocks(absolute_path, self._sr, self._hop_length, self._block_frames, self._margin_frames,
+                           self._n_fft, self._res_type)
+
+
 class CQTStrategy(ExtractionStrategy):
 
     @classmethod
     def factory(cls, config, *args, **kwargs):
         log(cls, "Init")
-        return CQTStrategy(config["SAMPLING_FREQUENCY"],
-                           config["HOP_LENGTH"],
+        return CQTStrategy(analysis_sampling_frequency(config),
+                           analysis_hop_length(config),
                            config["MIN_FREQ"],
                            config["N_BINS"],
-                           config["BINS_PER_OCTAVE"])
+                           config["BINS_PER_OCTAVE"],
+                           pipeline_dtype(config))
 
     def __init__(self, sampling_frequency: int, hop_length: int, min_freq: int, n_bins: int,
-                 bins_per_octave: int) -> None:
+                 bins_per_octave: int, dtype: str = None) -> None:
         super().__init__()
 
         self.bins_per_octave = bins_per_octave
@@ -117,16 +372,60 @@ class CQTStrategy(ExtractionStrategy):
         self._min_freq = min_freq
         self._hop_length = hop_length
         self._sr = sampling_frequency
+        self._dtype = dtype
 
-    def run(self, y: np.ndarray) -> np.ndarray:
+    def _cqt(self, y: np.ndarray) -> np.ndarray:
+        # with a pipeline dtype the transform itself runs in its complex counterpart
+        _dtype = {} if self._dtype is None else {"dtype": np.promote_types(self._dtype, np.complex64)}
         return np.abs(librosa.cqt(y,
                                   sr=self._sr,
                                   hop_length=self._hop_length,
                                   fmin=self._min_freq,
                                   bins_per_octave=self.bins_per_octave,
-                                  n_bins=self._n_bins)
+                                  n_bins=self._n_bins,
+                                  **_dtype)
                       )
 
+    def run(self, y: np.ndarray, analysis: AnalysisContext = None) -> np.ndarray:
+        if analysis is None:
+            return self._cqt(y)
+        return analysis.memoize(("cqt", self._sr, self._hop_length, self._min_freq, self.bins_per_octave,
+                                 self._n_bins, self._dtype), self._cqt, y)
+
+
+class BlockCQTStrategy(CQTStrategy):
+    """ CQT of AudioBlocks computed block by block, the onset envelope for beat tracking is collected on the way """
+
+    @classmethod
+    def factory(cls, config, *args, **kwargs):
+        log(cls, "Init")
+        return BlockCQTStrategy(analysis_sampling_frequency(config),
+                                analysis_hop_length(config),
+                                config["MIN_FREQ"],
+                                config["N_BINS"],
+                                config["BINS_PER_OCTAVE"],
+                                pipeline_dtype(config))
+
+    def stream(self, blocks: AudioBlocks) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        if blocks.hop_length != self._hop_length or blocks.sr != self._sr:
+            raise IllegalArgumentError
+
+        for block in blocks:
+            yield blocks.trim(self._cqt(block)), blocks.trim(blocks.onset_strength(block))
+
+    def run(self, y, analysis: AnalysisContext = None) -> np.ndarray:
+        if not isinstance(y, AudioBlocks):
+            return super().run(y, analysis)
+
+        _cqt = list()
+        _onset = list()
+        for c, onset in self.stream(y):
+            _cqt.append(c)
+            _onset.append(onset)
+
+        y.onset_envelope = np.concatenate(_onset)
+        return np.concatenate(_cqt, axis=1)[:, :y.n_frames]
+
 
 class SmoothingFrameStrategy(FrameStrategy):
 
@@ -134,7 +433,7 @@ class SmoothingFrameStrategy(FrameStrategy):
     def factory(cls, config, *args, **kwargs):
         log(cls, "Init")
         return SmoothingFrameStrategy(
-            config["HOP_LENGTH"],
+            analysis_hop_length(config),
             config["MIN_FREQ"],
             config["BINS_PER_OCTAVE"],
             config["N_OCTAVES"]
@@ -147,7 +446,7 @@ class SmoothingFrameStrategy(FrameStrategy):
         self._bins_per_octave = bins_per_octave
         self._n_octaves = n_octaves
 
-    def run(self, c: np.ndarray) -> np.ndarray:
+    def run(self, c: np.ndarray, analysis: AnalysisContext = None) -> np.ndarray:
         chroma = librosa.feature.chroma_cqt(
             C=c,
             hop_length=self._hop_length,
@@ -156,10 +455,117 @@ class SmoothingFrameStrategy(FrameStrategy):
             n_octaves=self._n_octaves
         )
 
-        return np.minimum(chroma,
-                          librosa.decompose.nn_filter(chroma,
-                                                      aggregate=np.median,
-                                                      metric='cosine'))
+        return np.minimum(chroma, nn_filter(chroma))
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    # like sklearn.preprocessing.normalize, rows of a negligible norm are left as they are
+    _norm = np.sqrt(np.einsum("ij,ij->i", x, x))
+    _norm[_norm < 10 * np.finfo(_norm.dtype).eps] = 1
+    return x / _norm[:, None]
+
+
+def nn_filter(x: np.ndarray, block: int = 1024) -> np.ndarray:
+    """ librosa.decompose.nn_filter(x, aggregate=np.median, metric='cosine') without scikit-learn: the median of
+    k = 2 * ceil(sqrt(frames - 1)) of the k + 2 frames nearest in cosine distance, picked the way the recurrence
+    matrix of librosa picks them. Distances are computed `block` frames at a time. """
+    n = x.shape[1]
+    if n < 5:
+        raise IllegalArgumentError("Too few frames = " + str(n))
+    k = int(2 * ceil(np.sqrt(n - 1)))
+    n_neighbors = min(n - 1, k + 2)
+    # librosa keeps the first k of the neighbours in column order permuted by an argsort of equal values
+    _kept = np.argsort(np.ones((1, n_neighbors)))[0][:k]
+
+    _x = _unit_rows(x.T)
+    out = np.empty_like(x)
+    for start in range(0, n, block):
+        stop = min(n, start + block)
+        _rows = np.arange(stop - start)[:, None]
+        _d = -_x[start:stop].dot(_x.T)
+        _d += 1
+        np.clip(_d, 0, 2, out=_d)
+        _d[_rows[:, 0], np.arange(start, stop)] = 0
+
+        # n_neighbors nearest besides the frame itself, or besides the nearest one when it is not among them
+        _nearest = np.argpartition(_d, n_neighbors, axis=1)[:, :n_neighbors + 1]
+        _nearest = _nearest[_rows, np.argsort(_d[_rows, _nearest], axis=1)]
+        _mask = _nearest != np.arange(start, stop)[:, None]
+        _mask[np.all(_mask, axis=1), 0] = False
+        _nearest = np.sort(_nearest[_mask].reshape(stop - start, n_neighbors), axis=1)[:, _kept]
+
+        out[:, start:stop] = np.median(x[:, _nearest], axis=2)
+    return out
+
+
+def local_nn_filter(x: np.ndarray, window: int, k: int = None) -> np.ndarray:
+    """ Median of the k most cosine-similar frames among the `window` frames on either side of each frame.
+    Time and memory are O(frames * window), unlike the full recurrence matrix of librosa.decompose.nn_filter. """
+    if window < 1 or (k is not None and k < 1):
+        raise IllegalArgumentError("Window and k must be >= 1")
+    n = x.shape[1]
+    offsets = np.concatenate((np.arange(-window, 0), np.arange(1, window + 1)))
+    k = min(k or 2 * int(ceil(np.sqrt(2 * window))), len(offsets))
+
+    _norm = np.linalg.norm(x, axis=0)
+    _x = x / np.where(_norm > 0, _norm, 1)
+
+    # similarity of every frame to the frame at each offset, -inf past the edges
+    sim = np.full((len(offsets), n), -np.inf, dtype=_x.dtype)
+    for j, d in enumerate(offsets):
+        if d >= n or -d >= n:
+            continue
+        if d > 0:
+            sim[j, :n - d] = np.einsum('ij,ij->j', _x[:, :n - d], _x[:, d:])
+        else:
+            sim[j, -d:] = np.einsum('ij,ij->j', _x[:, -d:], _x[:, :n + d])
+
+    nearest = np.argpartition(-sim, k - 1, axis=0)[:k]
+    valid = np.isfinite(np.take_along_axis(sim, nearest, axis=0))
+    neighbours = x[:, np.clip(np.arange(n) + offsets[nearest], 0, n - 1)]
+
+    if valid.all():
+        return np.median(neighbours, axis=1)
+
+    # frames closer to the edges than k frames have fewer neighbours, frames without any are kept
+    with np.errstate(invalid='ignore'):
+        _median = np.nanmedian(np.where(valid, neighbours, np.nan), axis=1)
+    return np.where(np.isnan(_median), x, _median)
+
+
+class LocalSmoothingFrameStrategy(SmoothingFrameStrategy):
+    """ SmoothingFrameStrategy with the nearest neighbours searched in a window around each frame """
+
+    @classmethod
+    def factory(cls, config, *args, **kwargs):
+        log(cls, "Init")
+        return LocalSmoothingFrameStrategy(
+            analysis_hop_length(config),
+            config["MIN_FREQ"],
+            config["BINS_PER_OCTAVE"],
+            config["N_OCTAVES"],
+            config["NN_WINDOW"],
+            config["NN_K"]
+        )
+
+    def __init__(self, hop_length: int, min_freq: int, bins_per_octave: int, n_octaves: int, window: int = 64,
+                 k: int = None) -> None:
+        super().__init__(hop_length, min_freq, bins_per_octave, n_octaves)
+        if window < 1 or (k is not None and k < 1):
+            raise IllegalArgumentError
+        self._window = window
+        self._k = k
+
+    def run(self, c: np.ndarray, analysis: AnalysisContext = None) -> np.ndarray:
+        chroma = librosa.feature.chroma_cqt(
+            C=c,
+            hop_length=self._hop_length,
+            fmin=self._min_freq,
+            bins_per_octave=self._bins_per_octave,
+            n_octaves=self._n_octaves
+        )
+
+        return np.minimum(chroma, local_nn_filter(chroma, self._window, self._k))
 
 
 class HPSSFrameStrategy(FrameStrategy):
@@ -168,7 +574,7 @@ class HPSSFrameStrategy(FrameStrategy):
     def factory(cls, config, *args, **kwargs):
         log(cls, "Init")
         return HPSSFrameStrategy(
-            config["HOP_LENGTH"],
+            analysis_hop_length(config),
             config["MIN_FREQ"],
             config["BINS_PER_OCTAVE"],
             config["N_OCTAVES"]
@@ -181,8 +587,11 @@ class HPSSFrameStrategy(FrameStrategy):
         self._bins_per_octave = bins_per_octave
         self._n_octaves = n_octaves
 
-    def run(self, c: np.ndarray) -> np.ndarray:
-        h, p = librosa.decompose.hpss(c)
+    def run(self, c: np.ndarray, analysis: AnalysisContext = None) -> np.ndarray:
+        if analysis is None:
+            h, p = hpss(c)
+        else:
+            h, p = analysis.memoize(("cqt_hpss", self._hop_length, self._min_freq, self._bins_per_octave), hpss, c)
 
         chroma = librosa.feature.chroma_cqt(
             C=h,
@@ -192,10 +601,7 @@ class HPSSFrameStrategy(FrameStrategy):
             n_octaves=self._n_octaves
         )
 
-        chroma = np.minimum(chroma,
-                            librosa.decompose.nn_filter(chroma,
-                                                        aggregate=np.median,
-                                                        metric='cosine'))
+        chroma = np.minimum(chroma, nn_filter(chroma))
         return chroma
 
 
@@ -205,18 +611,34 @@ class BeatSegmentationStrategy(SegmentationStrategy):
     def factory(cls, config, *args, **kwargs):
         log(cls, "Init")
         return BeatSegmentationStrategy(
-            config["SAMPLING_FREQUENCY"],
-            config["HOP_LENGTH"]
+            analysis_sampling_frequency(config),
+            analysis_hop_length(config),
+            analysis_n_fft(config)
         )
 
-    def __init__(self, sampling_frequency: int, hop_length: int) -> None:
+    def __init__(self, sampling_frequency: int, hop_length: int, n_fft: int = 2048) -> None:
         super().__init__()
 
         self._hop_length = hop_length
         self._sr = sampling_frequency
-
-    def run(self, y: np.ndarray, chroma: np.ndarray) -> (np.ndarray, Any):
-        tempo, beat_f = librosa.beat.beat_track(y=y, sr=self._sr, hop_length=self._hop_length, trim=False)
+        self._n_fft = n_fft
+
+    def _onset_envelope(self, y: np.ndarray) -> np.ndarray:
+        # the envelope beat_track computes from y, built once per track and window
+        return librosa.onset.onset_strength(y=y, sr=self._sr, hop_length=self._hop_length, n_fft=self._n_fft,
+                                            aggregate=np.median)
+
+    def run(self, y: np.ndarray, chroma: np.ndarray, analysis: AnalysisContext = None) -> (np.ndarray, Any):
+        if isinstance(y, AudioBlocks):
+            onset_envelope = y.onset_envelope
+        elif analysis is not None:
+            onset_envelope = analysis.memoize(("onset_envelope", self._sr, self._n_fft, self._hop_length),
+                                              self._onset_envelope, y)
+        else:
+            onset_envelope = self._onset_envelope(y)
+
+        tempo, beat_f = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=self._sr,
+                                                hop_length=self._hop_length, trim=False)
         beat_f = librosa.util.fix_frames(beat_f, x_max=chroma.shape[1])
         frames = librosa.util.sync(chroma, beat_f, aggregate=np.median)
         beat_t = librosa.frames_to_time(beat_f, sr=self._sr, hop_length=self._hop_length)
@@ -230,7 +652,7 @@ class NoSegmentationStrategy(SegmentationStrategy):
         log(cls, "Init")
         return NoSegmentationStrategy()
 
-    def run(self, y: np.ndarray, chroma: np.ndarray) -> (np.ndarray, None):
+    def run(self, y: np.ndarray, chroma: np.ndarray, analysis: AnalysisContext = None) -> (np.ndarray, None):
         return y, None
 
 
@@ -244,34 +666,82 @@ class OneVectorSegmentationStrategy(SegmentationStrategy):
     def __init__(self) -> None:
         super().__init__()
 
-    def run(self, y: np.ndarray, chroma: np.ndarray) -> (np.ndarray, None):
+    def run(self, y: np.ndarray, chroma: np.ndarray, analysis: AnalysisContext = None) -> (np.ndarray, None):
         vector = librosa.util.sync(chroma, [0], aggregate=np.median)
         return vector.flatten(), None
 
 
+class HCDFSegmenter(FrameSegmenter):
+    """ Segments at the peaks of the HCDF, each segment is summarized by its median vector """
+
+    def __init__(self, prominence: float, wlen: int) -> None:
+        super().__init__()
+
+        self._hcdf = IncrementalHCDF(prominence, wlen)
+        self._frames = None
+        self._start = 0
+
+    def _segments(self, boundaries: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        _bounds = np.concatenate(([self._start], boundaries))
+        _local = _bounds - self._start
+        _vectors = np.stack(tuple(np.median(self._frames[:, a:b], axis=1) for a, b in zip(_local, _local[1:])),
+                            axis=1)
+
+        self._frames = self._frames[:, _local[-1]:]
+        self._start = _bounds[-1]
+        yield _vectors, _bounds
+
+    def push(self, frame: int, chroma: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        if self._frames is None:
+            self._frames = chroma
+            self._start = frame
+        else:
+            self._frames = np.concatenate((self._frames, chroma), axis=1)
+
+        _peaks = self._hcdf.push(chroma)
+        if len(_peaks) > 0:
+            yield from self._segments(_peaks)
+
+    def flush(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        if self._frames is None:
+            return
+
+        _end = self._start + self._frames.shape[1]
+        _peaks = self._hcdf.flush()
+        if _end > self._start:
+            yield from self._segments(np.append(_peaks, _end))
+
+
 class HCDFSegmentationStrategy(SegmentationStrategy):
 
     @classmethod
     def factory(cls, config, *args, **kwargs):
         log(cls, "Init")
         return HCDFSegmentationStrategy(
-            config["SAMPLING_FREQUENCY"],
-            config["HOP_LENGTH"]
+            analysis_sampling_frequency(config),
+            analysis_hop_length(config),
+            config["HCDF_WINDOW"]
         )
 
-    def __init__(self, sampling_frequency: int, hop_length: int) -> None:
+    def __init__(self, sampling_frequency: int, hop_length: int, window: int = 64) -> None:
         super().__init__()
 
         self._hop_length = hop_length
         self._sr = sampling_frequency
+        self._window = window
+
+    def segmenter(self) -> HCDFSegmenter:
+        return HCDFSegmenter(0.5, self._window)
 
-    def run(self, y: np.ndarray, chroma: np.ndarray) -> (np.ndarray, None):
+    def run(self, y: np.ndarray, chroma: np.ndarray, analysis: AnalysisContext = None) -> (np.ndarray, None):
         _segments, _peaks = get_segments(chroma)
         _med_segments = list()
         for vectors in _segments:
             vector = librosa.util.sync(vectors, [0], aggregate=np.median)
             _med_segments.append(vector.flatten())
-        return np.array(_med_segments).T, librosa.frames_to_time(_peaks, sr=self._sr, hop_length=self._hop_length)
+        # the peaks end the segments, the first one starts at 0
+        return np.array(_med_segments).T, librosa.frames_to_time(np.concatenate(([0], _peaks)), sr=self._sr,
+                                                                 hop_length=self._hop_length)
 
 
 class AudioProcessing(Strategy):
@@ -283,11 +753,13 @@ class AudioProcessing(Strategy):
             config["AP_LOAD_STRATEGY_CLASS"].factory(config),
             config["AP_STFT_STRATEGY_CLASS"].factory(config),
             config["AP_CHROMA_STRATEGY_CLASS"].factory(config),
-            config["AP_BEAT_STRATEGY_CLASS"].factory(config)
+            config["AP_BEAT_STRATEGY_CLASS"].factory(config),
+            make_cache(config),
+            pipeline_dtype(config)
         )
 
     def __init__(self, load_strategy: LoadStrategy, stft_strategy: ExtractionStrategy, chroma_strategy: FrameStrategy,
-                 beat_strategy: SegmentationStrategy) -> None:
+                 beat_strategy: SegmentationStrategy, cache: FeatureCache = None, dtype: str = None) -> None:
         super().__init__()
 
         if load_strategy is None:
@@ -303,10 +775,140 @@ class AudioProcessing(Strategy):
         self.stft_strategy = stft_strategy
         self.chroma_strategy = chroma_strategy
         self.beat_strategy = beat_strategy
+        self.cache = cache if cache is not None else NoCache()
+        self.dtype = dtype
+        # intermediates of the last file, until another one is processed
+        self._analysis = AnalysisContext()
+
+    def _analysis_of(self, absolute_path: Path) -> AnalysisContext:
+        """ Context of the file, kept across calls so that a stage the feature cache misses reuses the decoded
+        signal, separations and transforms computed for the file before """
+        _key = file_stat_key(absolute_path)
+        if self._analysis.key != _key:
+            self._analysis = AnalysisContext(absolute_path, _key)
+        return self._analysis
+
+    def _cached(self, key: str, func, *args):
+        value = self.cache.get(key)
+        if value is None:
+            value = cast(func(*args), self.dtype)
+            self.cache.put(key, value)
+        return value
+
+    def pipeline_key(self) -> str:
+        """ Key of the parameters of all stages, equal for pipelines giving equal features """
+        return make_key(self.dtype, strategy_key(self.load_strategy), strategy_key(self.stft_strategy),
+                        strategy_key(self.chroma_strategy), strategy_key(self.beat_strategy))
 
     def process(self, absolute_path: Path) -> (np.ndarray, Any):
         log(self.__class__, "Processing = " + str(absolute_path.resolve()))
-        y = self.load_strategy.run(absolute_path)
-        c = self.stft_strategy.run(y)
-        chroma = self.chroma_strategy.run(c)
-        return self.beat_strategy.run(y, chroma)
+
+        if isinstance(self.cache, NoCache):
+            # nothing is looked up, the file is not hashed
+            k_load = k_stft = k_chroma = k_beat = None
+        else:
+            # every stage is keyed by the audio content and the parameters of all stages up to it
+            k_load = make_key(file_digest(absolute_path), self.dtype, strategy_key(self.load_strategy))
+            k_stft = make_key(k_load, strategy_key(self.stft_strategy))
+            k_chroma = make_key(k_stft, strategy_key(self.chroma_strategy))
+            k_beat = make_key(k_chroma, strategy_key(self.beat_strategy))
+
+        result = self.cache.get(k_beat)
+        if result is not None:
+            return result
+
+        analysis = self._analysis_of(absolute_path)
+        y = self._cached(k_load, self.load_strategy.run, absolute_path, analysis)
+        chroma = self.cache.get(k_chroma)
+        if chroma is None:
+            c = self._cached(k_stft, self.stft_strategy.run, y, analysis)
+            chroma = self._cached(k_chroma, self.chroma_strategy.run, c, analysis)
+        return self._cached(k_beat, self.beat_strategy.run, y, chroma, analysis)
+
+
+class StreamProcessing(Strategy):
+    """ Incremental feature extraction over a stream of PCM blocks at the sampling frequency of the config.
+    Chroma is emitted in chunks of `chunk_frames` hops, once `margin_frames` hops of lookahead are available. """
+
+    @classmethod
+    def factory(cls, config, *args, **kwargs):
+        log(cls, "Init")
+        # blocks arrive at SAMPLING_FREQUENCY, resampling them one by one would leave seams
+        config = ChainMap({"ANALYSIS_SAMPLING_FREQUENCY": None}, config)
+        return StreamProcessing(
+            config["AP_STFT_STRATEGY_CLASS"].factory(config),
+            config["AP_CHROMA_STRATEGY_CLASS"].factory(config),
+            config["SAMPLING_FREQUENCY"],
+            config["HOP_LENGTH"],
+            max(1, round(config["STREAM_LATENCY"] * config["SAMPLING_FREQUENCY"] / config["HOP_LENGTH"])),
+            config["BLOCK_MARGIN"],
+            pipeline_dtype(config)
+        )
+
+    def __init__(self, stft_strategy: ExtractionStrategy, chroma_strategy: FrameStrategy, sampling_frequency: int,
+                 hop_length: int, chunk_frames: int, margin_frames: int, dtype: str = None) -> None:
+        super().__init__()
+
+        if stft_strategy is None:
+            raise IllegalArgumentError
+        if chroma_strategy is None:
+            raise IllegalArgumentError
+        if chunk_frames <= 0 or margin_frames < 0:
+            raise IllegalArgumentError
+
+        self.stft_strategy = stft_strategy
+        self.chroma_strategy = chroma_strategy
+        self._sr = sampling_frequency
+        self._hop_length = hop_length
+        self._chunk_frames = chunk_frames
+        self._margin_frames = margin_frames
+        self._dtype = dtype
+
+        # leading silence plays the role of the padding of centered frames
+        self._buffer = np.zeros(margin_frames * hop_length, dtype=np.float32)
+        self._n_samples = 0
+        self._frame = 0
+        self._history = None
+
+    def frame_time(self, frame: int) -> float:
+        return frame * self._hop_length / self._sr
+
+    def _process(self, n_frames: int) -> Tuple[int, np.ndarray]:
+        margin = self._margin_frames * self._hop_length
+        window = self._buffer[:n_frames * self._hop_length + 2 * margin]
+
+        y_harm = librosa.effects.harmonic(y=window, margin=8)
+        c = cast(self.stft_strategy.run(y_harm)[:, self._margin_frames:self._margin_frames + n_frames], self._dtype)
+
+        # the previous chunk gives the chroma filters some temporal context
+        _c = c if self._history is None else np.concatenate((self._history, c), axis=1)
+        chroma = cast(self.chroma_strategy.run(_c)[:, -n_frames:], self._dtype)
+
+        self._history = c[:, -self._chunk_frames:]
+        self._buffer = self._buffer[n_frames * self._hop_length:]
+        frame = self._frame
+        self._frame += n_frames
+        return frame, chroma
+
+    def push(self, y: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+        """ Appends a block of samples, yields (first frame, chroma) of every chunk which became complete """
+        y = np.asarray(y, dtype=np.float32)
+        if y.ndim > 1:
+            y = np.mean(y, axis=-1)
+
+        self._buffer = np.concatenate((self._buffer, y))
+        self._n_samples += len(y)
+
+        window = (self._chunk_frames + 2 * self._margin_frames) * self._hop_length
+        while len(self._buffer) >= window:
+            yield self._process(self._chunk_frames)
+
+    def flush(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """ Yields the frames left at the end of the stream """
+        n_frames = 1 + self._n_samples // self._hop_length - self._frame
+        if n_frames <= 0:
+            return
+
+        window = (n_frames + 2 * self._margin_frames) * self._hop_length
+        self._buffer = np.pad(self._buffer, (0, max(window - len(self._buffer), 0)))
+        yield self._process(n_frames)
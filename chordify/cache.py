@@ -0,0 +1,279 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from hashlib import sha1
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from chordify.logger import log
+
+_CACHE_VERSION = 2
+_PRIMITIVES = (bool, int, float, str, type(None))
+
+# digests of the most recently hashed files
+_DIGESTS_MAX = 4096
+_digests: 'OrderedDict[Tuple[str, int, int], str]' = OrderedDict()
+_digests_lock = Lock()
+
+
+def file_stat_key(absolute_path: Path) -> Tuple[str, int, int]:
+    """ Path, size and modification time, changed by any write to the file """
+    stat = os.stat(absolute_path)
+    return str(absolute_path), stat.st_size, stat.st_mtime_ns
+
+
+def file_digest(absolute_path: Path, block_size: int = 1 << 20) -> str:
+    """ Content hash of the file, memoized by path, size and modification time """
+    memo_key = file_stat_key(absolute_path)
+    with _digests_lock:
+        if memo_key in _digests:
+            _digests.move_to_end(memo_key)
+            return _digests[memo_key]
+
+    _hash = sha1()
+    with open(absolute_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            _hash.update(block)
+
+    digest = _hash.hexdigest()
+    with _digests_lock:
+        _digests[memo_key] = digest
+        if len(_digests) > _DIGESTS_MAX:
+            _digests.popitem(last=False)
+    return digest
+
+
+def strategy_key(strategy) -> Tuple:
+    """ Class and primitive parameters of the strategy, the part of its state which changes its output """
+    _params = tuple(sorted((k, v) for k, v in vars(strategy).items() if isinstance(v, _PRIMITIVES)))
+    return strategy.__class__.__module__, strategy.__class__.__qualname__, _params
+
+
+def make_key(*parts) -> str:
+    return sha1(repr((_CACHE_VERSION,) + parts).encode("utf-8")).hexdigest()
+
+
+def _cacheable(value: Any) -> bool:
+    if isinstance(value, np.ndarray):
+        return True
+    return isinstance(value, tuple) and all(v is None or isinstance(v, np.ndarray) for v in value)
+
+
+def _freeze(value: Any):
+    # stored arrays are shared by every hit, changing one in place would change them all
+    for v in (value,) if isinstance(value, np.ndarray) else value:
+        if v is not None:
+            v.flags.writeable = False
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return sum(v.nbytes for v in value if v is not None)
+
+
+class FeatureCache(ABC):
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, value: Any):
+        pass
+
+
+class NoCache(FeatureCache):
+
+    def get(self, key: str) -> Any:
+        return None
+
+    def put(self, key: str, value: Any):
+        pass
+
+
+class DiskCache(FeatureCache):
+    """ Content addressed cache of pipeline intermediates, values are arrays or tuples of arrays """
+
+    def __init__(self, directory: Path) -> None:
+        super().__init__()
+
+        self._directory = directory
+
+    def _path(self, key: str) -> Path:
+        return self._directory / key[:2] / key
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            return np.load(path.with_suffix(".npy"), allow_pickle=False)
+        except FileNotFoundError:
+            pass
+        try:
+            with np.load(path.with_suffix(".npz"), allow_pickle=False) as npz:
+                return tuple(npz[str(i)] if str(i) in npz else None for i in range(int(npz["n"])))
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, value: Any):
+        if not _cacheable(value):
+            return
+        suffix = ".npy" if isinstance(value, np.ndarray) else ".npz"
+
+        path = self._path(key).with_suffix(suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write aside and rename, so that concurrent workers never read a partial file
+        with NamedTemporaryFile(dir=path.parent, suffix=suffix, delete=False) as f:
+            if suffix == ".npy":
+                np.save(f, value, allow_pickle=False)
+            else:
+                np.savez(f, n=len(value), **{str(i): v for i, v in enumerate(value) if v is not None})
+        os.replace(f.name, path)
+        log(self.__class__, "Stored = " + str(path))
+
+
+class MemoryCache(FeatureCache):
+    """ Least recently used cache bounded by the total size of the stored arrays. Stored arrays are made read-only,
+    every hit returns the same array. """
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__()
+
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes: int):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict(0)
+
+    def _evict(self, nbytes: int):
+        while self._entries and self.nbytes + nbytes > self._max_bytes:
+            _, (_, _nb) = self._entries.popitem(last=False)
+            self.nbytes -= _nb
+            self.evictions += 1
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any):
+        if not _cacheable(value):
+            return
+        nbytes = _nbytes(value)
+        if nbytes > self._max_bytes:
+            return
+
+        _freeze(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._evict(nbytes)
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, entries=len(self._entries),
+                    nbytes=self.nbytes, max_bytes=self._max_bytes)
+
+
+class TieredCache(FeatureCache):
+    """ Looks up the caches in order, values found in a later cache are promoted to the earlier ones """
+
+    def __init__(self, *caches: FeatureCache) -> None:
+        super().__init__()
+
+        self._caches = caches
+
+    def get(self, key: str) -> Any:
+        for i, cache in enumerate(self._caches):
+            value = cache.get(key)
+            if value is not None:
+                for _cache in self._caches[:i]:
+                    _cache.put(key, value)
+                return value
+        return None
+
+    def put(self, key: str, value: Any):
+        for cache in self._caches:
+            cache.put(key, value)
+
+
+_memory_cache = MemoryCache(0)
+
+
+def shared_memory_cache(max_bytes: int) -> MemoryCache:
+    """ Process wide cache of pipeline intermediates, the last requested budget wins """
+    _memory_cache.max_bytes = max_bytes
+    return _memory_cache
+
+
+def make_cache(config) -> FeatureCache:
+    caches = list()
+    if config["CACHE_MAX_BYTES"]:
+        caches.append(shared_memory_cache(config["CACHE_MAX_BYTES"]))
+    if config["CACHE_DIR"] is not None:
+        caches.append(DiskCache(Path(config["CACHE_DIR"])))
+
+    if len(caches) == 0:
+        return NoCache()
+    if len(caches) == 1:
+        return caches[0]
+    return TieredCache(*caches)
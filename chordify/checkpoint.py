@@ -0,0 +1,182 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import json
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from chordify.logger import log
+from .exceptions import IllegalArgumentError
+from .music import VECTOR_DTYPE, VECTOR_SIZE
+
+_MANIFEST = "manifest.jsonl"
+
+
+class CheckpointStore(object):
+    """ Append-only store of the vectors extracted from training files. A JSON lines manifest maps the content
+    digest of every file to its vector or to its failure, every entry is synced to disk before `put` or `fail`
+    returns. Vectors are compacted into shards of `shard_size` rows, the manifest then points to their rows.
+    Entries of another pipeline `key` are ignored, failed files are extracted again on the next run. """
+
+    def __init__(self, directory: Union[Path, str], key: str, shard_size: int = 256) -> None:
+        super().__init__()
+        log(self.__class__, "Init")
+
+        if shard_size < 1:
+            raise IllegalArgumentError
+
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self.key = key
+        self.shard_size = shard_size
+
+        self._rows: Dict[str, tuple] = dict()
+        self.failures: Dict[str, str] = dict()
+        self._n_shards = 0
+        _journal = self._read_manifest()
+
+        self._pending = np.empty((shard_size, VECTOR_SIZE), dtype=VECTOR_DTYPE)
+        self._pending_entries = list()
+        self._shards: Dict[int, np.ndarray] = dict()
+        # vectors stored by a run which ended before their shard was written
+        for digest, (path, vector) in _journal.items():
+            self._stage(digest, path, vector)
+
+    def _read_manifest(self) -> Dict[str, tuple]:
+        """ Reads the rows and failures of the key, returns the (path, vector) of the files not in a shard yet """
+        _journal = dict()
+        try:
+            with open(self._directory / _MANIFEST, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        continue
+                    if "shard" in entry:
+                        self._n_shards = max(self._n_shards, entry["shard"] + 1)
+                    if entry.get("key") != self.key:
+                        continue
+                    if entry["digest"] is None:
+                        # unreadable file, there was no content to key it by
+                        continue
+                    if "error" in entry:
+                        self.failures[entry["digest"]] = entry["error"]
+                    elif "vector" in entry:
+                        _journal[entry["digest"]] = (entry["path"], np.array(entry["vector"], dtype=VECTOR_DTYPE))
+                        self.failures.pop(entry["digest"], None)
+                    else:
+                        self._rows[entry["digest"]] = (entry["shard"], entry["row"])
+                        self.failures.pop(entry["digest"], None)
+                        _journal.pop(entry["digest"], None)
+        except FileNotFoundError:
+            pass
+        log(self.__class__, "Checkpointed = " + str(len(self._rows) + len(_journal)) + ", failed = " +
+            str(len(self.failures)))
+        return _journal
+
+    def _shard_path(self, shard: int) -> Path:
+        return self._directory / ("vectors-%05d.npy" % shard)
+
+    def _append_manifest(self, entries):
+        with open(self._directory / _MANIFEST, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        """ Vector of the file with the digest, None when it is not stored """
+        try:
+            shard, row = self._rows[digest]
+        except KeyError:
+            return None
+        if shard == self._n_shards:
+            return self._pending[row].copy()
+        if shard not in self._shards:
+            self._shards[shard] = np.load(self._shard_path(shard), mmap_mode="r", allow_pickle=False)
+        return np.array(self._shards[shard][row])
+
+    def _stage(self, digest: str, path: Union[Path, str], vector: np.ndarray):
+        _row = len(self._pending_entries)
+        self._pending[_row] = vector
+        self._pending_entries.append({"key": self.key, "digest": digest, "path": str(path),
+                                      "shard": self._n_shards, "row": _row})
+        self._rows[digest] = (self._n_shards, _row)
+        self.failures.pop(digest, None)
+        if len(self._pending_entries) == self.shard_size:
+            self.flush()
+
+    def put(self, digest: str, path: Union[Path, str], vector: np.ndarray):
+        """ Stores the vector of a finished file, durable once this returns """
+        if digest in self._rows:
+            return
+        _vector = np.asarray(vector, dtype=VECTOR_DTYPE).reshape(VECTOR_SIZE)
+        # float32 values round trip exactly through the float64 repr of JSON
+        self._append_manifest(({"key": self.key, "digest": digest, "path": str(path),
+                                "vector": _vector.astype(float).tolist()},))
+        self._stage(digest, path, _vector)
+
+    def fail(self, digest: Optional[str], path: Union[Path, str], error: BaseException):
+        log(self.__class__, "Failed = " + str(path) + ", " + repr(error))
+        if digest is not None:
+            self.failures[digest] = repr(error)
+        self._append_manifest(({"key": self.key, "digest": digest, "path": str(path), "error": repr(error)},))
+
+    def flush(self):
+        """ Writes the pending vectors as a new shard, then the manifest entries pointing to its rows """
+        if not self._pending_entries:
+            return
+        path = self._shard_path(self._n_shards)
+        # write aside and rename, the manifest never points at a partial shard
+        with NamedTemporaryFile(dir=self._directory, suffix=".npy", delete=False) as f:
+            np.save(f, self._pending[:len(self._pending_entries)], allow_pickle=False)
+        os.replace(f.name, path)
+        self._append_manifest(self._pending_entries)
+        log(self.__class__, "Stored = " + str(path))
+
+        self._pending_entries = list()
+        self._n_shards += 1
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
@@ -26,13 +26,68 @@
 #
 #
 from abc import *
-from typing import Sequence
+from functools import lru_cache
+from typing import List, Sequence, Tuple, Union
 
 import numpy as np
 
 from chordify.logger import log
-from .music import TemplateChords, HarmonicChords, Resolution, BasicResolution, IChord
+from .exceptions import IllegalArgumentError
+from .music import TemplateChords, HarmonicChords, Resolution, BasicResolution, IChord, Chord, chords_to_ids, \
+    CHORD_ID_DTYPE
+from .result import RecognitionResult
 from .strategy import Strategy
+from .vocabulary import Vocabulary, template_bank
+
+
+@lru_cache(maxsize=None)
+def template_matrix(chords: Tuple[Chord, ...]) -> np.ndarray:
+    """ Read-only matrix of the L2 normalized chord templates as rows, built once per process """
+    _templates = np.stack([np.asarray(chord.vector, dtype=np.float32) for chord in chords])
+    _templates /= np.linalg.norm(_templates, axis=1, keepdims=True)
+    _templates.flags.writeable = False
+    return _templates
+
+
+def viterbi(log_emissions: np.ndarray, self_transition: float = None, log_transition: np.ndarray = None) \
+        -> np.ndarray:
+    """ Most likely state sequences of a batch of (tracks, states, frames) log emissions, from a uniform start.
+    With `self_transition` every change of state is equally likely, which takes O(frames * states) time;
+    a full (states, states) `log_transition` matrix takes O(frames * states^2). The recursion runs over
+    frames, every step is vectorized over the states and the tracks. """
+    n_tracks, n_states, n_frames = log_emissions.shape
+    _states = np.arange(n_states)
+
+    # python floats and a transition matrix of the emission type keep float32 emissions from being upcast
+    if log_transition is None:
+        log_stay = float(np.log(self_transition))
+        log_move = float(np.log((1 - self_transition) / max(n_states - 1, 1)))
+    else:
+        log_transition = log_transition.astype(log_emissions.dtype, copy=False)
+
+    delta = log_emissions[:, :, 0] - float(np.log(n_states))
+    back = np.empty((n_tracks, n_states, n_frames), dtype=np.intp)
+    back[:, :, 0] = _states
+    for t in range(1, n_frames):
+        if log_transition is None:
+            best = np.argmax(delta, axis=1)
+            move = np.take_along_axis(delta, best[:, None], axis=1) + log_move
+            stay = delta + log_stay
+            from_stay = stay >= move
+            back[:, :, t] = np.where(from_stay, _states, best[:, None])
+            delta = np.where(from_stay, stay, move)
+        else:
+            _scores = delta[:, :, None] + log_transition
+            back[:, :, t] = np.argmax(_scores, axis=1)
+            delta = np.take_along_axis(_scores, back[:, None, :, t], axis=1)[:, 0]
+        delta = delta + log_emissions[:, :, t]
+
+    path = np.empty((n_tracks, n_frames), dtype=np.intp)
+    path[:, -1] = np.argmax(delta, axis=1)
+    _tracks = np.arange(n_tracks)
+    for t in range(n_frames - 1, 0, -1):
+        path[:, t - 1] = back[_tracks, path[:, t], t]
+    return path
 
 
 class PredictStrategy(Strategy):
@@ -41,6 +96,33 @@ class PredictStrategy(Strategy):
     def predict(self, chroma) -> Sequence[IChord]:
         pass
 
+    def predict_ids(self, chroma) -> np.ndarray:
+        """ Chord ids of the prediction, see chordify.music.CHORDS """
+        return np.fromiter((chord.id for chord in self.predict(chroma)), dtype=CHORD_ID_DTYPE)
+
+    def predict_ids_batch(self, chromas: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """ Chord ids of several tracks from one prediction over their concatenated frames, for recognizers that
+        decide every frame on its own """
+        if len(chromas) == 0:
+            return []
+        _ids = self.predict_ids(np.concatenate(chromas, axis=1))
+        return np.split(_ids, np.cumsum([c.shape[1] for c in chromas])[:-1])
+
+    def chord_ids(self) -> np.ndarray:
+        """ Chord ids of the rows of `scores` """
+        return chords_to_ids(tuple(self.chords))
+
+    def scores(self, chroma) -> np.ndarray:
+        """ (chords, frames) scores, higher is better """
+        raise NotImplementedError
+
+    def recognize(self, chroma: np.ndarray, times: np.ndarray = None) -> RecognitionResult:
+        """ Best chord of every frame together with the scores of all chords. The scores are the transpose of the
+        frame-major product, returned without a copy when they are float32. """
+        _scores = self.scores(chroma)
+        _ids = self.chord_ids()
+        return RecognitionResult(_ids[np.argmax(_scores, axis=0)], _scores.T, _ids, times)
+
     @property
     @abstractmethod
     def resolution(self) -> Resolution:
@@ -58,36 +140,152 @@ class TemplatePredictStrategy(PredictStrategy):
     def resolution(self) -> Resolution:
         return BasicResolution()
 
+    @property
+    def chords(self) -> Tuple[Chord, ...]:
+        return TemplateChords.ALL
+
+    def scores(self, chroma: np.ndarray) -> np.ndarray:
+        """ (chords, frames) similarity of every frame to every template, computed frame-major so the reductions over
+        chords run over contiguous memory """
+        return chroma.T.dot(template_matrix(self.chords).T).T
+
+    def predict_indices(self, chroma: np.ndarray, filter_func=lambda d: d) -> np.ndarray:
+        """ Index into `chords` of the best matching template of every frame. `filter_func` receives the
+        (chords, frames) matrix of template scores. """
+        return np.argmax(filter_func(self.scores(chroma)), axis=0)
+
     def predict(self, chroma: np.ndarray, filter_func=lambda d: d) -> tuple:
         log(self.__class__, "Predicting...")
-        _chord_prg = list()
-        _ch_v = np.array(list(map(lambda c: c.vector, TemplateChords.ALL)))
+        _chords = self.chords
+        return tuple(_chords[i] for i in self.predict_indices(chroma, filter_func))
 
-        for ch in chroma.T:
-            _dots = filter_func(_ch_v.dot(ch))
-            _chord_prg.append(TemplateChords.ALL[np.argmax(_dots)])
+    def predict_ids(self, chroma: np.ndarray, filter_func=lambda d: d) -> np.ndarray:
+        return self.chord_ids()[self.predict_indices(chroma, filter_func)]
 
-        return tuple(_chord_prg)
 
-
-class HarmonicPredictStrategy(PredictStrategy):
+class HarmonicPredictStrategy(TemplatePredictStrategy):
 
     @classmethod
     def factory(cls, config, *args, **kwargs):
         log(cls, "Init")
         return HarmonicPredictStrategy()
 
+    @property
+    def chords(self) -> Tuple[Chord, ...]:
+        return HarmonicChords.ALL
+
+
+class VocabularyPredictStrategy(TemplatePredictStrategy):
+    """ Template matching over a chord vocabulary of any size, see chordify.vocabulary """
+
+    @classmethod
+    def factory(cls, config, *args, **kwargs):
+        log(cls, "Init")
+        return VocabularyPredictStrategy(config["VOCABULARY"], config["VOCABULARY_HARMONICS"])
+
+    def __init__(self, vocabulary: Union[str, Vocabulary] = "sevenths", harmonics: bool = False) -> None:
+        super().__init__()
+        self.bank = template_bank(vocabulary, harmonics)
+
     @property
     def resolution(self) -> Resolution:
-        return BasicResolution()
+        return self.bank.vocabulary
 
-    def predict(self, chroma: np.ndarray, filter_func=lambda d: d) -> tuple:
+    @property
+    def chords(self) -> Tuple[IChord, ...]:
+        return self.bank.vocabulary.chords
+
+    def scores(self, chroma: np.ndarray) -> np.ndarray:
+        return self.bank.scores(chroma)
+
+    def chord_ids(self) -> np.ndarray:
+        return self.bank.ids
+
+    def top_k(self, chroma: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ Chord ids of the k best chords of every frame and their scores, both (k, frames) and best first """
+        _indices, _scores = self.bank.top_k(chroma, k)
+        return self.bank.ids[_indices], _scores
+
+
+class ViterbiPredictStrategy(PredictStrategy):
+    """ Decodes the chord sequence from the scores of another recognizer, the softmax of the scores over
+    `temperature` acts as emission probabilities and `self_transition` as the probability of keeping a chord """
+
+    @classmethod
+    def factory(cls, config, *args, **kwargs):
+        log(cls, "Init")
+        return ViterbiPredictStrategy(
+            config["VITERBI_SCORE_CLASS"].factory(config, *args, **kwargs),
+            config["VITERBI_SELF_TRANSITION"],
+            config["VITERBI_TEMPERATURE"]
+        )
+
+    def __init__(self, scorer: PredictStrategy, self_transition: float, temperature: float) -> None:
+        super().__init__()
+
+        if not 0 < self_transition < 1 or temperature <= 0:
+            raise IllegalArgumentError
+
+        self.scorer = scorer
+        self._self_transition = self_transition
+        self._temperature = temperature
+
+    @property
+    def resolution(self) -> Resolution:
+        return self.scorer.resolution
+
+    @property
+    def chords(self) -> Tuple[IChord, ...]:
+        return self.scorer.chords
+
+    def log_emissions(self, chroma: np.ndarray) -> np.ndarray:
+        _scores = self.scorer.scores(chroma) / self._temperature
+        _scores = _scores - np.max(_scores, axis=0, keepdims=True)
+        return _scores - np.log(np.sum(np.exp(_scores), axis=0, keepdims=True))
+
+    def predict_batch(self, chromas: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """ Decodes several tracks in one pass, returns the chord indices of each """
+        _emissions = tuple(self.log_emissions(chroma) for chroma in chromas)
+        _lengths = tuple(e.shape[1] for e in _emissions)
+
+        # frames past the end of a track have zero log emissions, alike for every chord, so the best path through
+        # them leaves the track from its own best last state and its frames decode as without the padding
+        _batch = np.zeros((len(_emissions), len(self.chords), max(_lengths, default=0)),
+                          dtype=np.result_type(np.float32, *_emissions))
+        for i, e in enumerate(_emissions):
+            _batch[i, :, :e.shape[1]] = e
+
+        if _batch.shape[2] == 0:
+            return [np.empty(0, dtype=np.intp) for _ in _lengths]
+        _paths = viterbi(_batch, self._self_transition)
+        return [path[:length] for path, length in zip(_paths, _lengths)]
+
+    def predict_indices(self, chroma: np.ndarray) -> np.ndarray:
+        return self.predict_batch((chroma,))[0]
+
+    def predict(self, chroma: np.ndarray) -> tuple:
         log(self.__class__, "Predicting...")
-        _chord_prg = list()
-        _ch_v = np.array(list(map(lambda c: c.vector, HarmonicChords.ALL)))
+        _chords = self.chords
+        return tuple(_chords[i] for i in self.predict_indices(chroma))
+
+    def chord_ids(self) -> np.ndarray:
+        return self.scorer.chord_ids()
+
+    def predict_ids(self, chroma: np.ndarray) -> np.ndarray:
+        return self.chord_ids()[self.predict_indices(chroma)]
+
+    def predict_ids_batch(self, chromas: Sequence[np.ndarray]) -> List[np.ndarray]:
+        _ids = self.chord_ids()
+        return [_ids[path] for path in self.predict_batch(chromas)]
 
-        for ch in chroma.T:
-            _dots = filter_func(_ch_v.dot(ch))
-            _chord_prg.append(HarmonicChords.ALL[np.argmax(_dots)])
+    def scores(self, chroma: np.ndarray) -> np.ndarray:
+        """ (chords, frames) posterior of every chord in every frame on its own, before decoding """
+        return np.exp(self.log_emissions(chroma))
 
-        return tuple(_chord_prg)
+    def recognize(self, chroma: np.ndarray, times: np.ndarray = None) -> RecognitionResult:
+        """ Decoded chords with the per frame posteriors """
+        _emissions = self.log_emissions(chroma)
+        _path = viterbi(_emissions[None], self._self_transition)[0] if _emissions.shape[1] > 0 \
+            else np.empty(0, dtype=np.intp)
+        _ids = self.chord_ids()
+        return RecognitionResult(_ids[_path], np.exp(_emissions).T, _ids, times)
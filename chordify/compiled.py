@@ -0,0 +1,194 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+from pathlib import Path
+from typing import BinaryIO, Dict, Union
+
+import numpy as np
+
+from .exceptions import IllegalArgumentError
+from .music import VECTOR_DTYPE, CHORD_ID_DTYPE
+
+COMPILED_FORMAT = "chordify.compiled"
+COMPILED_VERSION = 1
+
+
+class CompiledSVC(object):
+    """ Kernel SVC as plain arrays. The one-vs-one decisions of all class pairs are one product of the kernel with
+    a (support vectors, pairs) coefficient matrix, predictions are their votes like in libsvm. `classes_` are chord
+    ids, so `predict` gives chord ids. """
+
+    def __init__(self, classes: np.ndarray, support_vectors: np.ndarray, coefficients: np.ndarray,
+                 intercept: np.ndarray, kernel: str, gamma: float, coef0: float = 0.0, degree: int = 3) -> None:
+        super().__init__()
+        if kernel not in ("linear", "poly", "rbf", "sigmoid"):
+            raise IllegalArgumentError("Unsupported kernel = " + str(kernel))
+
+        self.classes_ = np.asarray(classes, dtype=CHORD_ID_DTYPE)
+        self.support_vectors = np.asarray(support_vectors, dtype=VECTOR_DTYPE)
+        self.coefficients = np.asarray(coefficients, dtype=VECTOR_DTYPE)
+        self.intercept = np.asarray(intercept, dtype=VECTOR_DTYPE)
+        self.kernel = kernel
+        self.gamma = float(gamma)
+        self.coef0 = float(coef0)
+        self.degree = int(degree)
+
+        _n = len(self.classes_)
+        self._pairs = np.array([(i, j) for i in range(_n) for j in range(i + 1, _n)], dtype=np.intp).reshape(-1, 2)
+        self._sv_norms = np.einsum("ij,ij->i", self.support_vectors, self.support_vectors)
+        # (pairs, classes) incidence, +1 for the first class of a pair and -1 for the second
+        self._incidence = np.zeros((len(self._pairs), _n), dtype=VECTOR_DTYPE)
+        self._incidence[np.arange(len(self._pairs)), self._pairs[:, 0]] = 1
+        self._incidence[np.arange(len(self._pairs)), self._pairs[:, 1]] = -1
+
+    @classmethod
+    def from_estimator(cls, estimator) -> 'CompiledSVC':
+        _n_classes = len(estimator.classes_)
+        # the attributes of a binary SVC are negated, libsvm decides for the first class of a pair when positive
+        _sign = -1 if _n_classes == 2 else 1
+        _dual = _sign * np.asarray(estimator.dual_coef_)
+        _starts = np.concatenate(([0], np.cumsum(estimator.n_support_)))
+
+        _coefficients = np.zeros((len(estimator.support_vectors_), _n_classes * (_n_classes - 1) // 2))
+        p = 0
+        for i in range(_n_classes):
+            for j in range(i + 1, _n_classes):
+                _coefficients[_starts[i]:_starts[i + 1], p] = _dual[j - 1, _starts[i]:_starts[i + 1]]
+                _coefficients[_starts[j]:_starts[j + 1], p] = _dual[i, _starts[j]:_starts[j + 1]]
+                p += 1
+
+        return CompiledSVC(estimator.classes_, estimator.support_vectors_, _coefficients,
+                           _sign * np.asarray(estimator.intercept_), estimator.kernel,
+                           getattr(estimator, "_gamma", estimator.gamma), estimator.coef0, estimator.degree)
+
+    def _kernel(self, x: np.ndarray) -> np.ndarray:
+        _products = x.dot(self.support_vectors.T)
+        if self.kernel == "linear":
+            return _products
+        if self.kernel == "poly":
+            return (self.gamma * _products + self.coef0) ** self.degree
+        if self.kernel == "sigmoid":
+            return np.tanh(self.gamma * _products + self.coef0)
+        _d = np.einsum("ij,ij->i", x, x)[:, None] + self._sv_norms[None, :] - 2 * _products
+        return np.exp(-self.gamma * np.maximum(_d, 0, out=_d), out=_d)
+
+    def pair_decisions(self, x: np.ndarray) -> np.ndarray:
+        """ (frames, pairs) one-vs-one decisions, positive for the first class of the pair """
+        return self._kernel(np.asarray(x, dtype=VECTOR_DTYPE)).dot(self.coefficients) + self.intercept
+
+    def _votes(self, decisions: np.ndarray) -> np.ndarray:
+        """ (frames, classes) one-vs-one votes, the first class of a pair wins when its decision is positive """
+        # every class is in n - 1 pairs, so its wins are half of n - 1 plus its wins minus its losses
+        _outcomes = np.where(decisions > 0, 1, -1).astype(VECTOR_DTYPE)
+        return (len(self.classes_) - 1 + _outcomes.dot(self._incidence)) / 2
+
+    def decision_function(self, x: np.ndarray) -> np.ndarray:
+        _decisions = self.pair_decisions(x)
+        if len(self.classes_) == 2:
+            return -_decisions[:, 0]
+        # votes with the summed confidences squashed below one vote, as the 'ovr' shape of scikit-learn
+        _confidences = _decisions.dot(self._incidence)
+        return self._votes(_decisions) + _confidences / (3 * (np.abs(_confidences) + 1))
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self._votes(self.pair_decisions(x)), axis=1)]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"classes": self.classes_, "support_vectors": self.support_vectors,
+                "coefficients": self.coefficients, "intercept": self.intercept, "kernel": np.array(self.kernel),
+                "parameters": np.array([self.gamma, self.coef0, self.degree])}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> 'CompiledSVC':
+        gamma, coef0, degree = arrays["parameters"]
+        return CompiledSVC(arrays["classes"], arrays["support_vectors"], arrays["coefficients"],
+                           arrays["intercept"], str(arrays["kernel"]), gamma, coef0, int(degree))
+
+
+class CompiledLinear(object):
+    """ Linear classifier as a (classes, 12) weight matrix, a single row for two classes """
+
+    def __init__(self, classes: np.ndarray, coef: np.ndarray, intercept: np.ndarray) -> None:
+        super().__init__()
+        self.classes_ = np.asarray(classes, dtype=CHORD_ID_DTYPE)
+        self.coef = np.asarray(coef, dtype=VECTOR_DTYPE)
+        self.intercept = np.asarray(intercept, dtype=VECTOR_DTYPE).reshape(-1)
+
+    @classmethod
+    def from_estimator(cls, estimator) -> 'CompiledLinear':
+        return CompiledLinear(estimator.classes_, estimator.coef_, estimator.intercept_)
+
+    def decision_function(self, x: np.ndarray) -> np.ndarray:
+        _decisions = np.asarray(x, dtype=VECTOR_DTYPE).dot(self.coef.T) + self.intercept
+        return _decisions[:, 0] if len(self.coef) == 1 else _decisions
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        _decisions = self.decision_function(x)
+        if _decisions.ndim == 1:
+            return self.classes_[(_decisions > 0).astype(np.intp)]
+        return self.classes_[np.argmax(_decisions, axis=1)]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"classes": self.classes_, "coef": self.coef, "intercept": self.intercept}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> 'CompiledLinear':
+        return CompiledLinear(arrays["classes"], arrays["coef"], arrays["intercept"])
+
+
+_KINDS = {"svc": CompiledSVC, "linear": CompiledLinear}
+
+
+def compile_estimator(estimator, ids: np.ndarray = None):
+    """ Plain array predictor of a fitted scikit-learn SVC or linear classifier. The classes of the estimator are
+    replaced by the chord ids `ids` when they are given. """
+    if hasattr(estimator, "support_vectors_"):
+        compiled = CompiledSVC.from_estimator(estimator)
+    elif hasattr(estimator, "coef_"):
+        compiled = CompiledLinear.from_estimator(estimator)
+    else:
+        raise IllegalArgumentError("Can not compile = " + type(estimator).__name__)
+    if ids is not None:
+        compiled.classes_ = np.asarray(ids, dtype=CHORD_ID_DTYPE)
+    return compiled
+
+
+def save_compiled(file: Union[Path, str, BinaryIO], compiled, resolution_ids: np.ndarray, fingerprint: str = None):
+    _kind = next(k for k, c in _KINDS.items() if isinstance(compiled, c))
+    np.savez(file, format=np.array(COMPILED_FORMAT), version=np.array(COMPILED_VERSION), kind=np.array(_kind),
+             resolution=np.asarray(resolution_ids, dtype=CHORD_ID_DTYPE), fingerprint=np.array(fingerprint or ""),
+             **compiled.arrays())
+
+
+def load_compiled(file: Union[Path, str, BinaryIO]) -> dict:
+    """ Compiled predictor with the chord ids of its classes and its resolution, in the layout of a model file """
+    with np.load(file, allow_pickle=False) as npz:
+        if str(npz["format"]) != COMPILED_FORMAT or int(npz["version"]) > COMPILED_VERSION:
+            raise IllegalArgumentError("Unsupported compiled model")
+        compiled = _KINDS[str(npz["kind"])].from_arrays(npz)
+        return {"estimator": compiled, "ids": compiled.classes_, "resolution": npz["resolution"],
+                "fingerprint": str(npz["fingerprint"]) or None}
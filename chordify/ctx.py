@@ -216,7 +216,7 @@ class Context(object):
                 self.chord_recognition = self.config["CHORD_RECOGNITION_CLASS"].factory(
                     self.config,
                     self.state,
-                    self.provide_file("model.pickle", "rb")
+                    self.provide_file(self.config["MODEL_PATH"], "rb")
                 )
                 self.plotter = self.config["PLOT_CLASS"].factory(self.config, self.state)
             elif state == AppState.LEARNING:
@@ -224,7 +224,7 @@ class Context(object):
                 self.chord_recognition = self.config["CHORD_LEARNING_CLASS"].factory(
                     self.config,
                     self.state,
-                    self.provide_file("model.pickle", "wb")
+                    self.provide_file(self.config["MODEL_PATH"], "wb")
                 )
                 self.plotter = self.config["PLOT_CLASS"].factory(self.config, self.state)
             else:
@@ -29,10 +29,8 @@
 
 from itertools import chain
 from types import FunctionType
-from typing import Iterable, List
+from typing import Iterable, List, TYPE_CHECKING
 
-import librosa.display
-import matplotlib.pyplot as plt
 #
 #  Permission is hereby granted, free of charge, to any person obtaining a copy of this
 #  software and associated documentation files (the "Software"), to deal in the Software
@@ -43,14 +41,16 @@ import matplotlib.pyplot as plt
 #
 #
 import numpy as np
-from matplotlib.axes import Axes
 
 from .annotation import ChordTimeline
 from .ctx import _chord_resolution
 from .logger import log
-from .music import BasicResolution, IChord
+from .music import IChord
 from .utils import score
 
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+
 
 class Plotter(object):
     _u_cols: int
@@ -105,7 +105,10 @@ class Plotter(object):
         self._n_func.append(func)
 
     def chromagram(self, chroma: np.ndarray, beat_time: np.ndarray):
-        def plot(ax: Axes):
+        # plotting libraries are only imported once a chart is requested
+        import librosa.display
+
+        def plot(ax: 'Axes'):
             librosa.display.specshow(chroma,
                                      y_axis='chroma',
                                      x_axis='time',
@@ -117,6 +120,9 @@ class Plotter(object):
         return self
 
     def prediction(self, predicted: ChordTimeline, annotation: ChordTimeline):
+        import librosa.display
+        import matplotlib.pyplot as plt
+
         self.width += 6
 
         _ch_str = ["N"]
@@ -128,12 +134,12 @@ class Plotter(object):
             except ValueError:
                 return 0
 
-        def plot_prediction(ax: Axes):
+        def plot_prediction(ax: 'Axes'):
             x = list(chain(*((start, stop) for start, stop, chord in predicted)))
             y = list(chain(*((index(chord), index(chord)) for start, stop, chord in predicted)))
 
             ax.set_yticklabels(_ch_str)
-            ax.set_yticks(range(0, len(tuple(BasicResolution())) + 1))
+            ax.set_yticks(range(0, len(_ch_str)))
             ax.set_ylabel('Chords')
             ax.set_xlim(0, predicted.duration())
             ax.set_xlabel('Time (s)')
@@ -145,12 +151,12 @@ class Plotter(object):
             for vl in predicted.stop():
                 ax.axvline(vl, color="green")
 
-        def plot_annotation(ax: Axes):
+        def plot_annotation(ax: 'Axes'):
             x = list(chain(*((start, stop) for start, stop, chord in annotation)))
             y = list(chain(*((index(chord), index(chord)) for start, stop, chord in annotation)))
 
             ax.set_yticklabels(_ch_str)
-            ax.set_yticks(range(0, len(tuple(BasicResolution())) + 1))
+            ax.set_yticks(range(0, len(_ch_str)))
             ax.set_ylabel('Chords')
             ax.set_xlim(0, annotation.duration())
             ax.set_xlabel('Time (s)')
@@ -164,7 +170,7 @@ class Plotter(object):
 
             ax.set_title("Chord Prediction " + str(round(score(predicted, annotation), 2)) + "%")
 
-        def plot(ax: Axes):
+        def plot(ax: 'Axes'):
             if annotation is not None:
                 plot_annotation(ax)
             plot_prediction(ax)
@@ -173,6 +179,10 @@ class Plotter(object):
         return self
 
     def show(self):
+        if len(self._n_func) == 0:
+            return
+        import matplotlib.pyplot as plt
+
         fig, axes = plt.subplots(nrows=self._n_rows, ncols=self._n_cols)
         fig.set_size_inches(w=self.width, h=self.height)
         self._n_func.reverse()
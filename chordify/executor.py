@@ -0,0 +1,271 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import multiprocessing
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from chordify.logger import log
+from .exceptions import IllegalArgumentError
+from .state import AppState
+
+# audio processing of a worker process, built once by the pool initializer
+_worker_processing = None
+
+_READ_AHEAD_CHUNK = 1 << 20
+
+# results of a chunk smaller than this are pickled, a shared memory block costs more than it saves
+_SHARED_MIN_BYTES = 1 << 16
+_SHARED_ALIGN = 64
+
+# array of a chunk result placed in a shared memory block
+_SharedArray = namedtuple("_SharedArray", ("offset", "shape", "dtype"))
+
+# (result, exception) of every path of a chunk, with the name of the block holding their arrays
+_Outcomes = Tuple[Optional[str], List[Tuple[Any, Optional[BaseException]]]]
+
+
+def _init_worker(config: dict):
+    global _worker_processing
+    _worker_processing = config["AUDIO_PROCESSING_CLASS"].factory(config, AppState.PREDICTING)
+
+
+def _extract_chunk(absolute_paths: Sequence[Path]) -> _Outcomes:
+    _outcomes = list()
+    for absolute_path in absolute_paths:
+        try:
+            _outcomes.append((_worker_processing.process(absolute_path), None))
+        except Exception as e:
+            _outcomes.append((None, e))
+    return _share(_outcomes)
+
+
+def _shareable(value) -> bool:
+    return isinstance(value, np.ndarray) and not value.dtype.hasobject
+
+
+def _share(outcomes: List[Tuple[Any, Optional[BaseException]]]) -> _Outcomes:
+    """ Moves the arrays of the results into one shared memory block, they are copied out by `_unshare` instead
+    of being pickled """
+    _arrays = [v for result, _ in outcomes if isinstance(result, tuple) for v in result if _shareable(v)]
+    _arrays += [result for result, _ in outcomes if _shareable(result)]
+    _aligned = [-(-a.nbytes // _SHARED_ALIGN) * _SHARED_ALIGN for a in _arrays]
+    if sum(_aligned) < _SHARED_MIN_BYTES:
+        return None, outcomes
+
+    shm = SharedMemory(create=True, size=sum(_aligned))
+    # the parent unlinks the block, it is not tracked as leaked when this worker exits
+    resource_tracker.unregister(shm._name, "shared_memory")
+    _offset = 0
+
+    def put(value):
+        nonlocal _offset
+        if not _shareable(value):
+            return value
+        np.ndarray(value.shape, value.dtype, buffer=shm.buf, offset=_offset)[...] = value
+        _shared = _SharedArray(_offset, value.shape, value.dtype.str)
+        _offset += -(-value.nbytes // _SHARED_ALIGN) * _SHARED_ALIGN
+        return _shared
+
+    try:
+        return shm.name, [(tuple(put(v) for v in result) if isinstance(result, tuple) else put(result), error)
+                          for result, error in outcomes]
+    finally:
+        shm.close()
+
+
+def _unshare(name: Optional[str], outcomes: List[Tuple[Any, Optional[BaseException]]]) \
+        -> List[Tuple[Any, Optional[BaseException]]]:
+    if name is None:
+        return outcomes
+
+    shm = SharedMemory(name=name)
+
+    def get(value):
+        if not isinstance(value, _SharedArray):
+            return value
+        return np.ndarray(value.shape, value.dtype, buffer=shm.buf, offset=value.offset).copy()
+
+    try:
+        return [(tuple(get(v) for v in result) if isinstance(result, tuple) else get(result), error)
+                for result, error in outcomes]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _release(future: Future):
+    # a chunk finished after its consumer went away, its block is freed unread
+    if not future.cancelled() and future.exception() is None and future.result()[0] is not None:
+        shm = SharedMemory(name=future.result()[0])
+        shm.close()
+        shm.unlink()
+
+
+def read_ahead(absolute_path: Path):
+    """ Brings the file into the page cache, so the decoder of a worker does not wait on the disk """
+    with open(absolute_path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while f.read(_READ_AHEAD_CHUNK):
+                pass
+
+
+def _worker_context():
+    _methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in _methods else "spawn")
+
+
+def effective_jobs(n_jobs: int = None) -> int:
+    """ Number of worker processes, None is every CPU and negative values count back from it like joblib """
+    _cpus = os.cpu_count() or 1
+    if n_jobs is None:
+        return _cpus
+    if n_jobs == 0:
+        raise IllegalArgumentError
+    return max(1, _cpus + 1 + n_jobs if n_jobs < 0 else n_jobs)
+
+
+class ExtractionExecutor(object):
+    """ Extracts features of many files at once. Files are read ahead by a thread pool while a pool of processes,
+    each with its own AudioProcessing, decodes and analyses them. Files are sent to the workers `chunksize` at a
+    time and large results come back through shared memory. With one job the files are processed in this process
+    by `audio_processing`. """
+
+    def __init__(self, config: Mapping, n_jobs: int = None, prefetch: int = 2, audio_processing=None,
+                 chunksize: int = 1) -> None:
+        super().__init__()
+        log(self.__class__, "Init")
+
+        if prefetch < 0 or chunksize < 1:
+            raise IllegalArgumentError
+
+        self.n_jobs = effective_jobs(n_jobs)
+        self.prefetch = prefetch
+        self.chunksize = chunksize
+        self._reader = ThreadPoolExecutor(max_workers=max(1, prefetch))
+        if self.n_jobs > 1:
+            # the configuration travels to the workers as a plain dict, ImmutableDict does not unpickle. Workers
+            # are not forked from this process, its reader threads may hold locks a forked child would inherit.
+            self._pool = ProcessPoolExecutor(max_workers=self.n_jobs, mp_context=_worker_context(),
+                                             initializer=_init_worker, initargs=(dict(config),))
+            self._audio_processing = None
+        else:
+            self._pool = None
+            self._audio_processing = audio_processing or config["AUDIO_PROCESSING_CLASS"].factory(
+                config, AppState.PREDICTING)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown()
+
+    def shutdown(self):
+        self._reader.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, absolute_paths: List[Path]) -> Future:
+        if self._pool is not None:
+            return self._pool.submit(_extract_chunk, absolute_paths)
+        _outcomes = list()
+        for absolute_path in absolute_paths:
+            try:
+                _outcomes.append((self._audio_processing.process(absolute_path), None))
+            except Exception as e:
+                _outcomes.append((None, e))
+        _future = Future()
+        _future.set_result((None, _outcomes))
+        return _future
+
+    @staticmethod
+    def _resolve(absolute_paths: List[Path], future: Future) -> List[Tuple[Path, Future]]:
+        """ One future per path of a finished chunk """
+        try:
+            _outcomes = _unshare(*future.result())
+        except Exception as e:
+            # the whole chunk was lost, e.g. by a worker that died
+            _outcomes = [(None, e)] * len(absolute_paths)
+
+        _futures = list()
+        for absolute_path, (result, error) in zip(absolute_paths, _outcomes):
+            _future = Future()
+            if error is None:
+                _future.set_result(result)
+            else:
+                _future.set_exception(error)
+            _futures.append((absolute_path, _future))
+        return _futures
+
+    def completed(self, paths: Iterable[Path]) -> Iterator[List[Tuple[Path, Future]]]:
+        """ Yields the extractions that finished together, in completion order. At most two chunks per worker are
+        in flight and `prefetch` more files are read ahead of them. """
+        _paths = iter(paths)
+        _ahead: deque = deque()
+        _running: Dict[Future, List[Path]] = dict()
+
+        def read_next() -> bool:
+            _path = next(_paths, None)
+            if _path is None:
+                return False
+            _path = Path(_path)
+            _ahead.append((_path, self._reader.submit(read_ahead, _path)))
+            return True
+
+        def fill():
+            while len(_running) < 2 * self.n_jobs and (_ahead or read_next()):
+                _chunk = list()
+                while len(_chunk) < self.chunksize and (_ahead or read_next()):
+                    _chunk.append(_ahead.popleft()[0])
+                _running[self._submit(_chunk)] = _chunk
+            while len(_ahead) < self.prefetch and read_next():
+                pass
+
+        try:
+            fill()
+            while _running:
+                _done, _ = wait(tuple(_running), return_when=FIRST_COMPLETED)
+                yield [item for _future in _done for item in self._resolve(_running.pop(_future), _future)]
+                fill()
+        finally:
+            for _future in _running:
+                _future.add_done_callback(_release)
+
+    def map(self, paths: Iterable[Path]) -> Iterator[Tuple[Path, Any]]:
+        """ Yields (path, extraction result) in completion order, raises the first failed extraction """
+        for _batch in self.completed(paths):
+            for _path, _future in _batch:
+                yield _path, _future.result()
@@ -36,34 +36,75 @@
 #
 #
 #
-from itertools import tee
-
-import librosa
 import numpy as np
 from numpy.linalg import norm
-from scipy.signal import find_peaks
+
+from .lazy import lazy_import
+
+librosa = lazy_import("librosa")
+signal = lazy_import("scipy.signal")
+
+# harmonic change is measured between frames this far apart
+_LAG = 2
 
 
-def _pairwise(iterable):
-    "s -> (s0,s1), (s1,s2), (s2, s3), ..."
-    a, b = tee(iterable)
-    next(b, None)
-    next(b, None)
-    return zip(a, b)
+def _tonnetz(frames: np.ndarray) -> np.ndarray:
+    return librosa.feature.tonnetz(chroma=frames)
 
 
 def hcdf(frames: np.ndarray):
     """ Harmonic change detect function """
-    _tonnetz = librosa.feature.tonnetz(chroma=frames)
+    _t = _tonnetz(frames)
+    return norm(_t[:, _LAG:] - _t[:, :-_LAG], ord=2, axis=0)  # euclidean distance
 
-    l2_seq = list()
-    for tv0, tv1 in _pairwise(_tonnetz.T):
-        d = norm(tv0 - tv1, ord=2)  # euclidean distance
-        l2_seq.append(d)
-    return np.array(l2_seq)
 
-
-def get_segments(frames: np.ndarray, prominence=0.5):
+def get_segments(frames: np.ndarray, prominence=0.5, wlen=None):
     _hcdf = hcdf(frames)
-    _peaks, _ = find_peaks(_hcdf, prominence=prominence)
+    _peaks, _ = signal.find_peaks(_hcdf, prominence=prominence, wlen=wlen)
     return np.array_split(frames, _peaks, axis=1), np.append(_peaks, np.size(frames, axis=1))
+
+
+class IncrementalHCDF(object):
+    """ HCDF of chroma arriving in chunks. A peak is confirmed once `wlen // 2` values after it are known, its
+    prominence is then the one find_peaks reports over the whole signal with the same `wlen`. """
+
+    def __init__(self, prominence=0.5, wlen=64) -> None:
+        super().__init__()
+
+        self._prominence = prominence
+        self._wlen = wlen
+        self._half = wlen // 2
+        self._tail = None
+        self._values = np.empty(0)
+        self._offset = 0
+        self._last_peak = -1
+
+    def _confirm(self, last: int) -> np.ndarray:
+        _peaks, _ = signal.find_peaks(self._values, prominence=self._prominence, wlen=self._wlen)
+        _peaks += self._offset
+        _peaks = _peaks[(_peaks > self._last_peak) & (_peaks <= last)]
+        if len(_peaks) > 0:
+            self._last_peak = _peaks[-1]
+        return _peaks
+
+    def push(self, frames: np.ndarray) -> np.ndarray:
+        """ Returns the newly confirmed peaks, as indices of the HCDF """
+        _t = _tonnetz(frames)
+        if self._tail is not None:
+            _t = np.concatenate((self._tail, _t), axis=1)
+        self._tail = _t[:, -_LAG:]
+        if _t.shape[1] <= _LAG:
+            return np.empty(0, dtype=int)
+
+        self._values = np.concatenate((self._values, norm(_t[:, _LAG:] - _t[:, :-_LAG], ord=2, axis=0)))
+        n = self._offset + len(self._values)
+        _peaks = self._confirm(n - 1 - self._half)
+
+        # keep the window of every value which may still be confirmed, and one more for the peak test
+        _drop = max(len(self._values) - (2 * self._half + 2), 0)
+        self._values = self._values[_drop:]
+        self._offset += _drop
+        return _peaks
+
+    def flush(self) -> np.ndarray:
+        return self._confirm(self._offset + len(self._values) - 1)
@@ -17,87 +17,128 @@
 #  OTHER DEALINGS IN THE SOFTWARE.
 #
 from abc import abstractmethod
-from collections import Sized, Iterator
-from pickle import dump, load
-from typing import List, Tuple, Dict, ContextManager
+from collections.abc import Sized, Iterable
+from pathlib import Path
+from typing import Tuple, ContextManager, Sequence, Union, TYPE_CHECKING
 
 import numpy as np
-from sklearn import svm
-from sklearn.base import BaseEstimator
-from sklearn.model_selection import GridSearchCV
-from sklearn.preprocessing import LabelEncoder
 
 from chordify.strategy import Strategy
 from .chord_recognition import PredictStrategy
 from .exceptions import IllegalArgumentError
+from .executor import effective_jobs
 from .logger import log
-from .music import Vector, IChord, Resolution, StrictResolution
+from .model import ModelRegistry, config_fingerprint, load_model, read_model, save_model
+from .music import Vector, IChord, Resolution, StrictResolution, NO_CHORD_ID, CHORD_ID_DTYPE, VECTOR_DTYPE, \
+    VECTOR_SIZE, chord_from_id, ids_to_chords
 from .state import AppState
 
+if TYPE_CHECKING:
+    from sklearn.base import BaseEstimator
+    from .model_selection import RGridSearchCV
 
-class RGridSearchCV(GridSearchCV):
-    _encoder: LabelEncoder
 
-    def __init__(self, estimator, param_grid, scoring=None, n_jobs=None, iid='deprecated', refit=True, cv=None,
-                 verbose=0, pre_dispatch='2*n_jobs', error_score=np.nan, return_train_score=False):
-        super().__init__(estimator, param_grid, scoring, n_jobs, iid, refit, cv, verbose, pre_dispatch, error_score,
-                         return_train_score)
-        self._encoder = LabelEncoder()
+def __getattr__(name):
+    # scikit-learn is imported on first use, models pickled before the split still find their classes here
+    if name == "RGridSearchCV":
+        from .model_selection import RGridSearchCV
+        return RGridSearchCV
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-    def fit(self, x: Tuple[Vector], y: Tuple[IChord] = None, groups=None, **fit_params):
-        _y = self._encoder.fit_transform(tuple(map(str, y)))
-        return super().fit(np.array(x), _y, groups, **fit_params)
 
-    def r_predict(self, vectors: np.ndarray, chord_resolution: Resolution) -> Tuple[IChord]:
-        _l_ch_map: Dict[str, IChord] = {str(r): r for r in chord_resolution}
-        _y = self.predict(vectors)
-        return tuple(map(lambda l: _l_ch_map[l], self._encoder.inverse_transform(_y)))
+class SupervisedVectors(Sized, Iterable):
+    """ Labelled vectors kept in a float32 (n, 12) matrix and an array of chord ids. Both grow by doubling, so
+    appending is amortized constant and `vectors` and `ids` are views, handed to the estimators as they are. """
 
+    _FILES = ("vectors", "ids")
+    _INITIAL_CAPACITY = 64
 
-class SupervisedVectors(Sized, Iterator):
-    _vectors: List[Vector]
-    _labels: List[IChord]
-
-    _n: int
+    _vectors: np.ndarray
+    _ids: np.ndarray
     _len: int
 
-    def __init__(self) -> None:
+    def __init__(self, capacity: int = _INITIAL_CAPACITY) -> None:
         super().__init__()
-        self._vectors = list()
-        self._labels = list()
-        self._n = 0
+        self._vectors = np.empty((max(1, capacity), VECTOR_SIZE), dtype=VECTOR_DTYPE)
+        self._ids = np.empty(max(1, capacity), dtype=CHORD_ID_DTYPE)
         self._len = 0
 
     def __iter__(self):
-        self._n = 0
-        return self
-
-    def __next__(self):
-        if self._n < self._len:
-            self._n += 1
-            return self._vectors[self._n - 1], self._labels[self._n - 1]
-        else:
-            raise StopIteration
+        for i in range(self._len):
+            yield Vector(self._vectors[i]), chord_from_id(self._ids[i])
 
-    def __getitem__(self, item):
-        return self._vectors[item], self._labels[item]
+    def __getitem__(self, item: int):
+        _i = range(self._len)[item]
+        return Vector(self._vectors[_i]), chord_from_id(self._ids[_i])
 
     def __len__(self) -> int:
         return self._len
 
+    def _reserve(self, n: int):
+        if self._len + n > len(self._ids):
+            _capacity = max(2 * len(self._ids), self._len + n)
+            _vectors = np.empty((_capacity, VECTOR_SIZE), dtype=VECTOR_DTYPE)
+            _vectors[:self._len] = self._vectors[:self._len]
+            _ids = np.empty(_capacity, dtype=CHORD_ID_DTYPE)
+            _ids[:self._len] = self._ids[:self._len]
+            self._vectors, self._ids = _vectors, _ids
+
     def append(self, vector: Vector, label: IChord):
         if vector is None or label is None:
             raise IllegalArgumentError
 
-        self._vectors.append(vector)
-        self._labels.append(label)
+        self._reserve(1)
+        self._vectors[self._len] = np.asarray(vector).reshape(VECTOR_SIZE)
+        self._ids[self._len] = label.id
         self._len += 1
 
-    def vectors(self) -> Tuple[Vector]:
-        return tuple(self._vectors)
+    def extend(self, vectors: np.ndarray, labels: Union[np.ndarray, Sequence[IChord]]):
+        """ Appends a (n, 12) block of vectors labelled by n chord ids or chords """
+        _vectors = np.asarray(vectors)
+        _ids = np.asarray(labels, dtype=CHORD_ID_DTYPE) if isinstance(labels, np.ndarray) else \
+            np.fromiter((label.id for label in labels), dtype=CHORD_ID_DTYPE, count=len(labels))
+        if _vectors.ndim != 2 or _vectors.shape[1] != VECTOR_SIZE or len(_vectors) != len(_ids):
+            raise IllegalArgumentError
+        if len(_ids) > 0 and _ids.max() > NO_CHORD_ID:
+            raise IllegalArgumentError
+
+        self._reserve(len(_ids))
+        self._vectors[self._len:self._len + len(_ids)] = _vectors
+        self._ids[self._len:self._len + len(_ids)] = _ids
+        self._len += len(_ids)
 
-    def labels(self) -> Tuple[IChord]:
-        return tuple(self._labels)
+    def vectors(self) -> np.ndarray:
+        """ Read-only (n, 12) view of the vectors """
+        _vectors = self._vectors[:self._len]
+        _vectors.flags.writeable = False
+        return _vectors
+
+    def ids(self) -> np.ndarray:
+        """ Read-only view of the chord ids of the vectors """
+        _ids = self._ids[:self._len]
+        _ids.flags.writeable = False
+        return _ids
+
+    def labels(self) -> Tuple[IChord, ...]:
+        return ids_to_chords(self._ids[:self._len])
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.vectors(), self.ids()
+
+    def save(self, directory: Union[Path, str]):
+        """ The vectors and the ids as .npy files, see `load` """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, value in zip(self._FILES, self.arrays()):
+            np.save(directory / (name + ".npy"), value, allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory: Union[Path, str]) -> 'SupervisedVectors':
+        directory = Path(directory)
+        _vectors, _ids = (np.load(directory / (name + ".npy"), allow_pickle=False) for name in cls._FILES)
+        supervised_vectors = SupervisedVectors(len(_ids))
+        supervised_vectors.extend(_vectors.astype(VECTOR_DTYPE, copy=False), _ids)
+        return supervised_vectors
 
 
 class LearnStrategy(PredictStrategy):
@@ -114,10 +155,12 @@ class LearnStrategy(PredictStrategy):
 class ScikitLearnStrategy(LearnStrategy):
 
     ch_resolution: StrictResolution
-    classifier: RGridSearchCV
+    classifier: 'RGridSearchCV'
+    fingerprint: str = None
 
-    def __init__(self, estimator: BaseEstimator, file: ContextManager, **kwargs) -> None:
-        self.classifier = RGridSearchCV(estimator, kwargs, cv=5, n_jobs=-1)
+    def __init__(self, estimator: 'BaseEstimator', file: ContextManager, classifier=None, **kwargs) -> None:
+        from .model_selection import RGridSearchCV
+        self.classifier = RGridSearchCV(estimator, kwargs, cv=5, n_jobs=-1) if classifier is None else classifier
         self.output_file = file
 
     @property
@@ -126,33 +169,156 @@ class ScikitLearnStrategy(LearnStrategy):
 
     def learn(self, supervised_vectors: SupervisedVectors):
         log(self.__class__, "Learning...")
-        self.ch_resolution = StrictResolution(supervised_vectors.labels())
-        self.classifier.fit(supervised_vectors.vectors(), supervised_vectors.labels())
+        _vectors, _ids = supervised_vectors.arrays()
+        self.ch_resolution = StrictResolution(ids_to_chords(np.unique(_ids)))
+        self.classifier.fit(_vectors, _ids)
         log(self.__class__, "Learning done...")
 
-        output_file = self.output_file
-        del self.output_file
-
-        with output_file as f:
+        # only the refitted estimator is kept, not the search with its cross-validation results
+        with self.output_file as f:
             log(self.__class__, "Dumping model = " + str(f))
-            dump(self, f)
+            save_model(f, self.classifier.best_estimator_, self.classifier.classes_, np.unique(_ids),
+                       self.fingerprint)
+
+    @property
+    def chords(self) -> Tuple[IChord]:
+        return self.classifier.r_classes(self.ch_resolution)
+
+    def scores(self, vectors: np.ndarray) -> np.ndarray:
+        _scores = self.classifier.decision_function(vectors.T)
+        if _scores.ndim == 1:
+            return np.stack((-_scores, _scores))
+        return _scores.T
 
     def predict(self, vectors: np.ndarray) -> Tuple[IChord]:
         log(self.__class__, "Predicting...")
         return self.classifier.r_predict(vectors.T, self.ch_resolution)
 
 
+class OnlineLearnStrategy(LearnStrategy):
+    """ Learns chord ids with an estimator supporting partial_fit, one mini-batch at a time. Every chord id is a
+    class from the start, so later batches may bring chords the model has not seen yet. """
+
+    fingerprint: str = None
+
+    def __init__(self, estimator: 'BaseEstimator', file: ContextManager) -> None:
+        self.estimator = estimator
+        self.output_file = file
+        self._classes = np.arange(NO_CHORD_ID + 1)
+        self._seen = np.zeros(NO_CHORD_ID + 1, dtype=bool)
+        self.n_samples = 0
+
+    @classmethod
+    def from_model(cls, path: str, file: ContextManager) -> 'OnlineLearnStrategy':
+        """ Continues learning of the model saved at the path """
+        _model = read_model(path)
+        if isinstance(_model, OnlineLearnStrategy):
+            _model.output_file = file
+            return _model
+        if not isinstance(_model, dict) or "n_samples" not in _model:
+            raise IllegalArgumentError("Not an online model: " + str(path))
+        strategy = OnlineLearnStrategy(_model["estimator"], file)
+        strategy._seen[_model["resolution"]] = True
+        strategy.n_samples = _model["n_samples"]
+        strategy.fingerprint = _model["fingerprint"]
+        return strategy
+
+    @property
+    def resolution(self) -> Resolution:
+        return StrictResolution(ids_to_chords(np.flatnonzero(self._seen)))
+
+    @property
+    def chords(self) -> Tuple[IChord, ...]:
+        return ids_to_chords(self._classes)
+
+    def chord_ids(self) -> np.ndarray:
+        return self._classes.astype(CHORD_ID_DTYPE)
+
+    def partial_learn(self, vectors: np.ndarray, ids: np.ndarray):
+        """ Updates the model with (n, 12) vectors labelled by n chord ids """
+        if len(vectors) != len(ids):
+            raise IllegalArgumentError
+        if len(ids) == 0:
+            return
+        self.estimator.partial_fit(vectors, ids, classes=self._classes)
+        self._seen[ids] = True
+        self.n_samples += len(ids)
+
+    def learn(self, supervised_vectors: SupervisedVectors):
+        log(self.__class__, "Learning...")
+        self.partial_learn(*supervised_vectors.arrays())
+        log(self.__class__, "Learning done, samples = " + str(self.n_samples))
+        self.save()
+
+    def save(self):
+        with self.output_file as f:
+            log(self.__class__, "Dumping model = " + str(f))
+            save_model(f, self.estimator, self._classes, np.flatnonzero(self._seen), self.fingerprint,
+                       n_samples=self.n_samples)
+
+    def scores(self, vectors: np.ndarray) -> np.ndarray:
+        return self.estimator.decision_function(vectors.T).T
+
+    def predict_ids(self, vectors: np.ndarray) -> np.ndarray:
+        return self.estimator.predict(vectors.T).astype(CHORD_ID_DTYPE)
+
+    def predict(self, vectors: np.ndarray) -> Tuple[IChord]:
+        log(self.__class__, "Predicting...")
+        return ids_to_chords(self.predict_ids(vectors))
+
+
+class SGDLearn(Strategy):
+    """ Online linear model, learning continues from the model at ONLINE_WARM_START when it is set """
+
+    def __new__(cls, estimator: 'BaseEstimator', state: AppState, file: ContextManager, warm_start: str = None,
+                *args, **kwargs) -> OnlineLearnStrategy:
+        if state == AppState.LEARNING:
+            if warm_start is None:
+                return OnlineLearnStrategy(estimator, file)
+            return OnlineLearnStrategy.from_model(warm_start, file)
+        else:
+            with file as f:
+                return load_model(f)
+
+    @classmethod
+    def factory(cls, config: dict, state: AppState, file: ContextManager, *args, **kwargs) -> PredictStrategy:
+        log(cls, "Init")
+        if state == AppState.PREDICTING:
+            return ModelRegistry.instance().get(config["MODEL_PATH"], config)
+        from sklearn.linear_model import SGDClassifier
+        strategy = SGDLearn(SGDClassifier(), state, file, config["ONLINE_WARM_START"])
+        strategy.fingerprint = config_fingerprint(config)
+        return strategy
+
+
+# wider than the grid search default, halving scores most of it on few vectors
+_HALVING_GRID = {"C": [0.1, 1, 10, 100, 1000], "gamma": ["scale", 0.1, 1, 10, 100]}
+
+
 class SVCLearn(Strategy):
 
-    def __new__(cls, estimator: BaseEstimator, state: AppState, file: ContextManager, *args,
+    def __new__(cls, estimator: 'BaseEstimator', state: AppState, file: ContextManager, *args,
                 **kwargs) -> ScikitLearnStrategy:
         if state == AppState.LEARNING:
             return ScikitLearnStrategy(estimator, file, **kwargs)
         else:
             with file as f:
-                return load(f)
+                return load_model(f)
 
     @classmethod
-    def factory(cls, config: dict, state: AppState, file: ContextManager, *args, **kwargs) -> ScikitLearnStrategy:
+    def factory(cls, config: dict, state: AppState, file: ContextManager, *args, **kwargs) -> PredictStrategy:
         log(cls, "Init")
-        return SVCLearn(svm.SVC(), state, file, C=[1, 50])
+        if state == AppState.PREDICTING:
+            return ModelRegistry.instance().get(config["MODEL_PATH"], config)
+        from sklearn import svm
+        from .model_selection import RGridSearchCV, KernelHalvingSearchCV
+        if config["SVC_SEARCH"] == "halving":
+            classifier = KernelHalvingSearchCV(config["SVC_PARAM_GRID"] or _HALVING_GRID, cv=5,
+                                               factor=config["SVC_HALVING_FACTOR"],
+                                               max_resources=config["SVC_MAX_RESOURCES"], n_jobs=config["CPU_BUDGET"])
+        else:
+            classifier = RGridSearchCV(svm.SVC(), config["SVC_PARAM_GRID"] or {"C": [1, 50]}, cv=5,
+                                       n_jobs=effective_jobs(config["CPU_BUDGET"]))
+        strategy = SVCLearn(svm.SVC(), state, file, classifier=classifier)
+        strategy.fingerprint = config_fingerprint(config)
+        return strategy
@@ -0,0 +1,214 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import zipfile
+from pathlib import Path
+from threading import Lock
+from typing import Any, BinaryIO, Dict, Mapping, Tuple, Union
+
+import numpy as np
+
+from chordify.logger import log
+from .cache import make_key
+from .chord_recognition import PredictStrategy
+from .compiled import compile_estimator, load_compiled, save_compiled
+from .exceptions import IllegalArgumentError
+from .music import IChord, Resolution, StrictResolution, CHORD_ID_DTYPE, ids_to_chords
+
+MODEL_FORMAT = "chordify.model"
+MODEL_VERSION = 1
+
+# the part of the config which changes the features a model is trained on
+_FINGERPRINT_KEYS = ("AP_LOAD_STRATEGY_CLASS", "AP_STFT_STRATEGY_CLASS", "AP_CHROMA_STRATEGY_CLASS",
+                     "SAMPLING_FREQUENCY", "ANALYSIS_SAMPLING_FREQUENCY", "N_BINS", "BINS_PER_OCTAVE", "MIN_FREQ",
+                     "HOP_LENGTH", "NN_WINDOW", "NN_K", "DTYPE")
+
+
+def config_fingerprint(config: Mapping) -> str:
+    def part(value):
+        return value.__module__ + "." + value.__qualname__ if isinstance(value, type) else str(value)
+
+    return make_key(tuple((k, part(config.get(k))) for k in _FINGERPRINT_KEYS))
+
+
+class EstimatorPredictStrategy(PredictStrategy):
+    """ Fitted estimator of a model file, class i of the estimator is the chord id `ids[i]` """
+
+    def __init__(self, estimator, ids: np.ndarray, resolution_ids: np.ndarray, fingerprint: str = None) -> None:
+        super().__init__()
+        self.estimator = estimator
+        self.ids = np.asarray(ids, dtype=CHORD_ID_DTYPE)
+        self.resolution_ids = np.asarray(resolution_ids, dtype=CHORD_ID_DTYPE)
+        self.fingerprint = fingerprint
+        # classes of a model pickled by an older version are not in the order of their chord ids
+        self._order = np.argsort(estimator.classes_)
+
+    @classmethod
+    def factory(cls, config: Mapping, *args, **kwargs) -> 'ModelHandle':
+        log(cls, "Init")
+        return ModelRegistry.instance().get(config["MODEL_PATH"], config)
+
+    @property
+    def resolution(self) -> Resolution:
+        return StrictResolution(ids_to_chords(self.resolution_ids))
+
+    @property
+    def chords(self) -> Tuple[IChord, ...]:
+        return ids_to_chords(self.ids)
+
+    def chord_ids(self) -> np.ndarray:
+        return self.ids
+
+    def scores(self, vectors: np.ndarray) -> np.ndarray:
+        _scores = self.estimator.decision_function(vectors.T)
+        if _scores.ndim == 1:
+            return np.stack((-_scores, _scores))
+        return _scores.T
+
+    def predict_ids(self, vectors: np.ndarray) -> np.ndarray:
+        _classes = self.estimator.classes_
+        return self.ids[self._order[np.searchsorted(_classes[self._order], self.estimator.predict(vectors.T))]]
+
+    def predict(self, vectors: np.ndarray) -> Tuple[IChord, ...]:
+        log(self.__class__, "Predicting...")
+        return ids_to_chords(self.predict_ids(vectors))
+
+
+def save_model(file: BinaryIO, estimator, ids: np.ndarray, resolution_ids: np.ndarray, fingerprint: str = None,
+               **extra):
+    """ Writes the fitted estimator with the chord id of each of its classes. Arrays are stored uncompressed, so
+    that `load_model` maps them from the file. """
+    import joblib
+    joblib.dump(dict(extra, format=MODEL_FORMAT, version=MODEL_VERSION, estimator=estimator,
+                     ids=np.asarray(ids, dtype=CHORD_ID_DTYPE),
+                     resolution=np.asarray(resolution_ids, dtype=CHORD_ID_DTYPE), fingerprint=fingerprint), file)
+
+
+def read_model(file: Union[Path, str, BinaryIO], mmap_mode: str = None) -> Any:
+    """ Content of a model file, a dict of the current format or a strategy pickled by an older version """
+    if zipfile.is_zipfile(file):
+        # compiled models load with numpy alone
+        if not isinstance(file, (Path, str)):
+            file.seek(0)
+        return load_compiled(file)
+
+    import joblib
+    _model = joblib.load(file, mmap_mode=mmap_mode if isinstance(file, (Path, str)) else None)
+    if isinstance(_model, dict) and _model.get("format") == MODEL_FORMAT and _model["version"] > MODEL_VERSION:
+        raise IllegalArgumentError("Unsupported model version = " + str(_model["version"]))
+    return _model
+
+
+def load_model(file: Union[Path, str, BinaryIO], config: Mapping = None, mmap_mode: str = "r") -> PredictStrategy:
+    _model = read_model(file, mmap_mode)
+    if not isinstance(_model, dict):
+        return _model
+
+    if config is not None and _model["fingerprint"] is not None and \
+            _model["fingerprint"] != config_fingerprint(config):
+        log(load_model, "Model trained with other features = " + str(file))
+    return EstimatorPredictStrategy(_model["estimator"], _model["ids"], _model["resolution"], _model["fingerprint"])
+
+
+def compile_model(file: Union[Path, str, BinaryIO], output: Union[Path, str, BinaryIO]):
+    """ Writes the model as arrays of a compiled predictor, which serve without scikit-learn or joblib """
+    _model = read_model(file)
+    if isinstance(_model, dict):
+        estimator, ids, resolution_ids, fingerprint = \
+            _model["estimator"], _model["ids"], _model["resolution"], _model["fingerprint"]
+    else:
+        # a strategy pickled by an older version
+        estimator = _model.estimator if hasattr(_model, "estimator") else _model.classifier.best_estimator_
+        ids, fingerprint = _model.chord_ids(), getattr(_model, "fingerprint", None)
+        resolution_ids = np.array(sorted(chord.id for chord in _model.resolution), dtype=CHORD_ID_DTYPE)
+    save_compiled(output, compile_estimator(estimator, ids), resolution_ids, fingerprint)
+
+
+class ModelHandle(object):
+    """ Model of a registry, every call goes to the model registered at the time of the call """
+
+    def __init__(self, registry: 'ModelRegistry', key: str) -> None:
+        super().__init__()
+        self._registry = registry
+        self._key = key
+
+    def __getattr__(self, name):
+        return getattr(self._registry.current(self._key), name)
+
+
+class ModelRegistry(object):
+    """ Models loaded once per process and shared by every context. `swap` replaces a model for all its handles
+    at once, calls running at the time finish with the model they started with. """
+
+    _instance: 'ModelRegistry' = None
+    _instance_lock = Lock()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._models: Dict[str, PredictStrategy] = dict()
+        self._lock = Lock()
+
+    @classmethod
+    def instance(cls) -> 'ModelRegistry':
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ModelRegistry()
+        return cls._instance
+
+    @staticmethod
+    def _key(path: Union[Path, str]) -> str:
+        return str(Path(path).resolve())
+
+    def current(self, key: str) -> PredictStrategy:
+        return self._models[key]
+
+    def get(self, path: Union[Path, str], config: Mapping = None) -> ModelHandle:
+        key = self._key(path)
+        if key not in self._models:
+            with self._lock:
+                if key not in self._models:
+                    log(self.__class__, "Loading = " + key)
+                    self._models[key] = load_model(key, config)
+        return ModelHandle(self, key)
+
+    def swap(self, path: Union[Path, str], model: PredictStrategy = None, config: Mapping = None):
+        """ Registers the model, loaded from the path when not given """
+        key = self._key(path)
+        _model = load_model(key, config) if model is None else model
+        with self._lock:
+            self._models[key] = _model
+        log(self.__class__, "Swapped = " + key)
+
+    def reload(self, path: Union[Path, str], config: Mapping = None):
+        """ Swaps in the model saved at the path if one from there is registered """
+        if self._key(path) in self._models:
+            self.swap(path, config=config)
+
+    def evict(self, path: Union[Path, str]):
+        with self._lock:
+            self._models.pop(self._key(path), None)
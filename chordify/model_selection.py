@@ -0,0 +1,166 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+from math import ceil, log as log_
+from typing import Tuple, Dict, List, Mapping, Sequence
+
+import numpy as np
+from sklearn.model_selection import GridSearchCV, ParameterGrid, StratifiedKFold
+from sklearn.preprocessing import LabelEncoder
+from sklearn.svm import SVC
+
+from .exceptions import IllegalArgumentError
+from .executor import effective_jobs
+from .logger import log
+from .music import IChord, Resolution, ids_to_chords
+
+
+class _ChordSearch(object):
+    """ Chords of the classes and predictions of a search fitted on chord ids """
+    _encoder: LabelEncoder = None
+
+    def r_classes(self, chord_resolution: Resolution) -> Tuple[IChord, ...]:
+        if self._encoder is None:
+            return ids_to_chords(self.classes_)
+        _l_ch_map: Dict[str, IChord] = {str(r): r for r in chord_resolution}
+        return tuple(_l_ch_map[l] for l in self._encoder.classes_)
+
+    def r_predict(self, vectors: np.ndarray, chord_resolution: Resolution) -> Tuple[IChord]:
+        _y = self.predict(vectors)
+        if self._encoder is None:
+            return ids_to_chords(_y)
+        _l_ch_map: Dict[str, IChord] = {str(r): r for r in chord_resolution}
+        return tuple(map(lambda l: _l_ch_map[l], self._encoder.inverse_transform(_y)))
+
+
+class RGridSearchCV(_ChordSearch, GridSearchCV):
+    """ Grid search fitted on chord ids. Models pickled before fitting on ids keep a label encoder of chord names. """
+
+    def fit(self, x: np.ndarray, y: np.ndarray = None, groups=None, **fit_params):
+        """ Fits (n, 12) vectors labelled by n chord ids """
+        self._encoder = None
+        return super().fit(x, y, groups=groups, **fit_params)
+
+
+def _squared_distances(x: np.ndarray) -> np.ndarray:
+    _norms = np.einsum("ij,ij->i", x, x)
+    _d = _norms[:, None] + _norms[None, :] - 2 * x.dot(x.T)
+    return np.maximum(_d, 0, out=_d)
+
+
+def _fold_score(kernel: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray, c: float) -> float:
+    _svc = SVC(kernel="precomputed", C=c).fit(kernel[np.ix_(train, train)], y[train])
+    return float(np.mean(_svc.predict(kernel[np.ix_(test, train)]) == y[test]))
+
+
+class KernelHalvingSearchCV(_ChordSearch):
+    """ Successive halving over C and gamma of an RBF SVC fitted on chord ids. Every round scores the candidates
+    left on `factor` times more vectors than the last one and keeps the best 1/`factor` of them. The kernel of a
+    round is computed once per gamma and shared by all folds and values of C, the best candidate is refitted on all
+    vectors as an ordinary RBF SVC. Kernels take n * n doubles, `max_resources` bounds the vectors of a round. """
+
+    def __init__(self, param_grid: Mapping[str, Sequence], cv: int = 5, factor: int = 3, min_resources: int = None,
+                 max_resources: int = None, n_jobs: int = None, random_state: int = 0) -> None:
+        super().__init__()
+        if factor < 2 or cv < 2:
+            raise IllegalArgumentError
+        if set(param_grid) - {"C", "gamma"}:
+            raise IllegalArgumentError("Only C and gamma are searched")
+
+        self.param_grid = param_grid
+        self.cv = cv
+        self.factor = factor
+        self.min_resources = min_resources
+        self.max_resources = max_resources
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _candidates(self, x: np.ndarray) -> List[Dict]:
+        _scale = 1.0 / (x.shape[1] * x.var()) if x.var() > 0 else 1.0
+        _grid = {"C": self.param_grid.get("C", (1.0,)), "gamma": self.param_grid.get("gamma", ("scale",))}
+        return [{"C": float(p["C"]), "gamma": _scale if p["gamma"] == "scale" else float(p["gamma"])}
+                for p in ParameterGrid(_grid)]
+
+    def fit(self, x: np.ndarray, y: np.ndarray = None):
+        """ Fits (n, 12) vectors labelled by n chord ids """
+        from joblib import Parallel, delayed, parallel_backend
+        from threadpoolctl import threadpool_limits
+
+        _x = np.asarray(x, dtype=np.float64)
+        _y = np.asarray(y)
+        _n_jobs = effective_jobs(self.n_jobs)
+        _candidates = self._candidates(_x)
+        # rounds until one candidate is left, the last one scores the whole bounded sample
+        _rounds = int(ceil(log_(len(_candidates)) / log_(self.factor) - 1e-9)) if len(_candidates) > 1 else 0
+        _max = min(len(_y), self.max_resources or len(_y))
+        _min = min(_max, self.min_resources or 2 * self.cv * len(np.unique(_y)))
+        _order = np.random.RandomState(self.random_state).permutation(len(_y))
+        self.cv_results_ = {"params": [], "iter": [], "n_resources": [], "mean_test_score": []}
+        _scores = {(c["C"], c["gamma"]): np.nan for c in _candidates}
+
+        # workers run libsvm on one thread each, this process uses the whole budget for the kernels
+        with threadpool_limits(limits=_n_jobs), parallel_backend("loky", inner_max_num_threads=1), \
+                Parallel(n_jobs=_n_jobs) as parallel:
+            for i in range(_rounds):
+                _n = max(_min, _max // self.factor ** (_rounds - 1 - i))
+                _index = np.sort(_order[:_n])
+                _xi, _yi = _x[_index], _y[_index]
+                _folds = list(StratifiedKFold(self.cv, shuffle=True, random_state=self.random_state).split(_xi, _yi))
+                _distances = _squared_distances(_xi)
+
+                _scores = dict()
+                for gamma in sorted({c["gamma"] for c in _candidates}):
+                    _kernel = np.exp(-gamma * _distances)
+                    _c_values = [c["C"] for c in _candidates if c["gamma"] == gamma]
+                    _fold_scores = parallel(delayed(_fold_score)(_kernel, _yi, train, test, c)
+                                            for c in _c_values for train, test in _folds)
+                    for j, c in enumerate(_c_values):
+                        _scores[(c, gamma)] = float(np.mean(_fold_scores[j * self.cv:(j + 1) * self.cv]))
+                del _distances
+
+                for candidate in _candidates:
+                    self.cv_results_["params"].append(candidate)
+                    self.cv_results_["iter"].append(i)
+                    self.cv_results_["n_resources"].append(_n)
+                    self.cv_results_["mean_test_score"].append(_scores[(candidate["C"], candidate["gamma"])])
+                log(self.__class__, "Round " + str(i) + ", vectors = " + str(_n) + ", candidates = " +
+                    str(len(_candidates)))
+
+                _candidates = sorted(_candidates, key=lambda c: -_scores[(c["C"], c["gamma"])])
+                _candidates = _candidates[:int(ceil(len(_candidates) / self.factor))]
+
+            self.best_params_ = _candidates[0]
+            self.best_score_ = _scores[(self.best_params_["C"], self.best_params_["gamma"])]
+            self.best_estimator_ = SVC(kernel="rbf", **self.best_params_).fit(_x, _y)
+        self.classes_ = self.best_estimator_.classes_
+        return self
+
+    def decision_function(self, x: np.ndarray) -> np.ndarray:
+        return self.best_estimator_.decision_function(x)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.best_estimator_.predict(x)
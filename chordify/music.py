@@ -27,21 +27,16 @@
 #
 
 from abc import abstractmethod, ABCMeta, ABC
-from collections import deque
 from enum import Enum
-from functools import cached_property
-from itertools import cycle, product, accumulate, chain
+from functools import cached_property, lru_cache
+from itertools import product, chain
 from math import log
-from operator import mul
-from typing import Tuple, List, Iterable, Collection, Sized, Sequence, Union
-
-from .exceptions import IllegalStateError, IllegalArgumentError
+from pathlib import Path
+from typing import Tuple, List, Iterable, Collection, Sized, Sequence, Union, Dict
 
+import numpy as np
 
-def _rotate_right(vector: 'Vector', r: int) -> 'Vector':
-    _vector = deque(vector)
-    _vector.rotate(r)
-    return Vector(_vector)
+from .exceptions import IllegalStateError, IllegalArgumentError
 
 
 def _frequency(pitch: int) -> float:
@@ -52,30 +47,23 @@ def _frequency(pitch: int) -> float:
     return pow(2, (pitch - 69) / 12) * 440
 
 
-def _harmonics(start: 'ChordKey', length=8) -> Tuple['ChordKey']:
-    fq = list(reversed(tuple(i * start.frequency() for i in range(1, length + 1))))
+def _harmonic_pitches(start: int, length=8) -> np.ndarray:
+    """ Pitch class nearest, on the linear frequency scale, to each of the first `length` harmonics of `start` """
+    _n = 12 * (int(log(length, 2)) + 1)
+    _pitch = np.arange(_n)
+    _freq = np.power(2, (_pitch - 69) / 12) * 440
+    _subject = np.arange(1, length + 1) * _frequency(start)
 
-    chk_seq: List['ChordKey'] = list()
+    # first pitch not below the harmonic, harmonics above every pitch are dropped
+    _above = np.searchsorted(_freq, _subject, side="left")
+    _subject, _above = _subject[_above < _n], _above[_above < _n]
+    _below = np.maximum(_above - 1, 0)
+    _nearest = np.where(_subject - _freq[_below] < _freq[_above] - _subject, _below, _above)
+    return _nearest % 12
 
-    while len(fq) > 0:
-        subject = fq.pop()
 
-        before: ChordKey = start
-        for i, k in zip(range(12 * (int(log(length, 2)) + 1)),
-                        cycle(k for k in ChordKey.__iter__() if k != ChordKey.N)):
-            if _frequency(i) < subject:
-                before = k
-            else:
-                d_bs = subject - _frequency(i - 1 if i - 1 >= 0 else 0)
-                d_cs = _frequency(i) - subject
-
-                if d_bs < d_cs:
-                    chk_seq.append(before)
-                else:
-                    chk_seq.append(k)
-                break
-
-    return tuple(chk_seq)
+def _harmonics(start: 'ChordKey', length=8) -> Tuple['ChordKey']:
+    return tuple(_ID_KEYS[p] for p in _harmonic_pitches(start.pos(), length))
 
 
 def _harm_to_vector(harms: Collection) -> 'Vector':
@@ -88,15 +76,70 @@ def _harm_to_vector(harms: Collection) -> 'Vector':
 
 
 class ChordType(Enum):
+    """ Chord qualities in Harte notation, inversions are types of their own named by the interval in the bass """
     MAJOR = ""
     MINOR = ":min"
     AUGMENTED = ":aug"
     DIMINISHED = ":dim"
+    SUSPENDED2 = ":sus2"
+    SUSPENDED4 = ":sus4"
+    MAJOR6 = ":maj6"
+    MINOR6 = ":min6"
+    DOMINANT7 = ":7"
+    MAJOR7 = ":maj7"
+    MINOR7 = ":min7"
+    DIMINISHED7 = ":dim7"
+    HALF_DIMINISHED7 = ":hdim7"
+    MINOR_MAJOR7 = ":minmaj7"
+    DOMINANT9 = ":9"
+    MAJOR9 = ":maj9"
+    MINOR9 = ":min9"
+    MAJOR_3 = "/3"
+    MAJOR_5 = "/5"
+    MINOR_B3 = ":min/b3"
+    MINOR_5 = ":min/5"
+    DOMINANT7_3 = ":7/3"
+    DOMINANT7_5 = ":7/5"
+    DOMINANT7_B7 = ":7/b7"
 
     def __str__(self):
         return '%s' % self.value
 
 
+BASIC_TYPES: Tuple[ChordType, ...] = (ChordType.MAJOR, ChordType.MINOR, ChordType.AUGMENTED, ChordType.DIMINISHED)
+
+# semitones above the root of the notes of every chord type, the first one is in the bass
+CHORD_INTERVALS: Dict[ChordType, Tuple[int, ...]] = {
+    ChordType.MAJOR: (0, 4, 7),
+    ChordType.MINOR: (0, 3, 7),
+    ChordType.AUGMENTED: (0, 4, 8),
+    ChordType.DIMINISHED: (0, 3, 6),
+    ChordType.SUSPENDED2: (0, 2, 7),
+    ChordType.SUSPENDED4: (0, 5, 7),
+    ChordType.MAJOR6: (0, 4, 7, 9),
+    ChordType.MINOR6: (0, 3, 7, 9),
+    ChordType.DOMINANT7: (0, 4, 7, 10),
+    ChordType.MAJOR7: (0, 4, 7, 11),
+    ChordType.MINOR7: (0, 3, 7, 10),
+    ChordType.DIMINISHED7: (0, 3, 6, 9),
+    ChordType.HALF_DIMINISHED7: (0, 3, 6, 10),
+    ChordType.MINOR_MAJOR7: (0, 3, 7, 11),
+    ChordType.DOMINANT9: (0, 4, 7, 10, 14),
+    ChordType.MAJOR9: (0, 4, 7, 11, 14),
+    ChordType.MINOR9: (0, 3, 7, 10, 14),
+    ChordType.MAJOR_3: (4, 0, 7),
+    ChordType.MAJOR_5: (7, 0, 4),
+    ChordType.MINOR_B3: (3, 0, 7),
+    ChordType.MINOR_5: (7, 0, 3),
+    ChordType.DOMINANT7_3: (4, 0, 7, 10),
+    ChordType.DOMINANT7_5: (7, 0, 4, 10),
+    ChordType.DOMINANT7_B7: (10, 0, 4, 7),
+}
+
+# weight of the bass note of an inversion, it is all that tells the inversion from the root position in chroma
+_BASS_WEIGHT = 1.5
+
+
 class ChordKey(Enum):
     C = "C"
     Cs = "C#"
@@ -116,70 +159,85 @@ class ChordKey(Enum):
         return '%s' % self.value
 
     def frequency(self):
-        for i, k in enumerate(self.__class__.__iter__()):
-            if k == self:
-                return _frequency(i)
-        raise IllegalStateError
+        return _frequency(_KEY_POS[self])
 
     def pos(self):
-        for i, k in enumerate(self.__class__.__iter__()):
-            if k == self:
-                return i
-        raise IllegalStateError
+        return _KEY_POS[self]
+
+
+_KEY_POS: Dict[ChordKey, int] = {k: i for i, k in enumerate(ChordKey)}
+
+
+VECTOR_DTYPE = np.float32
+VECTOR_SIZE = 12
 
 
 class Vector(Sized, Iterable):
-    _vector: Tuple[float, ...]
+    """ Read-only 12 dimensional float32 vector, a float32 chroma column is wrapped without a copy """
+    __slots__ = ("_vector",)
+    _vector: np.ndarray
 
-    def __init__(self, vector: Sequence[float]) -> None:
+    def __init__(self, vector: Union[Sequence[float], np.ndarray]) -> None:
         super().__init__()
 
-        self._vector = tuple(vector)
+        _vector = np.asarray(vector, dtype=VECTOR_DTYPE).reshape(-1)
+        if _vector.shape != (VECTOR_SIZE,):
+            raise IllegalArgumentError
+        _vector.flags.writeable = False
+        self._vector = _vector
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or np.dtype(dtype) == self._vector.dtype:
+            return self._vector.copy() if copy else self._vector
+        return self._vector.astype(dtype)
 
     def __iter__(self):
-        return iter(self._vector)
+        return iter(self._vector.tolist())
 
     def __len__(self):
-        return len(self._vector)
+        return VECTOR_SIZE
 
     def __getitem__(self, item):
         return self._vector[item]
 
     def __sub__(self, other):
         if isinstance(other, Vector):
-            _r = tuple(a - b for a, b in zip(self._vector, other._vector))
-            m = max(_r)
-            return Vector(tuple(a / m for a in _r))
+            _r = self._vector - other._vector
+            return Vector(_r / np.max(_r))
         raise NotImplementedError
 
     def __add__(self, other):
         if isinstance(other, Vector):
-            _r = tuple(a + b for a, b in zip(self._vector, other._vector))
-            m = max(_r)
-            return Vector(tuple(a / m for a in _r))
+            _r = self._vector + other._vector
+            return Vector(_r / np.max(_r))
         raise NotImplementedError
 
     def __mul__(self, other):
         if isinstance(other, Vector):
-            return sum(a * b for a, b in zip(self._vector, other._vector))
+            return float(np.dot(self._vector, other._vector))
         raise NotImplementedError
 
     def __repr__(self):
-        return '(' + ', '.join(map(str, self._vector)) + ')'
+        return '(' + ', '.join(map(str, self._vector.tolist())) + ')'
 
 
 class MutableVector(Vector):
+    """ Owns a writable copy of its data """
+    __slots__ = ()
+
+    def __init__(self, vector: Union[Sequence[float], np.ndarray]) -> None:
+        super().__init__(np.array(vector, dtype=VECTOR_DTYPE))
+        self._vector.flags.writeable = True
 
     def __setitem__(self, key, value):
-        _vector = list(self._vector)
-        _vector[key] = float(value)
-        self._vector = tuple(_vector)
+        self._vector[key] = value
 
 
 class ZeroVector(MutableVector):
+    __slots__ = ()
 
     def __init__(self) -> None:
-        super().__init__(tuple(0.0 for i in range(12)))
+        super().__init__(np.zeros(VECTOR_SIZE, dtype=VECTOR_DTYPE))
 
 
 class IChord(object):
@@ -204,14 +262,18 @@ class IChord(object):
 
     def __lt__(self, other):
         if isinstance(other, IChord):
-            return self.__repr__() < other.__repr__()
+            return self.id < other.id
         raise NotImplementedError
 
     def __gt__(self, other):
         if isinstance(other, IChord):
-            return self.__repr__() > other.__repr__()
+            return self.id > other.id
         raise NotImplementedError
 
+    @property
+    def id(self) -> int:
+        return _CHORD_IDS.get((self._chord_key, self._chord_type), NO_CHORD_ID)
+
     def __hash__(self):
         return hash((self._chord_key, self._chord_type))
 
@@ -222,6 +284,51 @@ class IChord(object):
             return '%s' % self._chord_key.value
 
 
+# Chords are numbered type by type and key by key, in the order of TemplateChords.ALL, followed by no chord.
+# The tables map between ids, labels and chords in constant time.
+_ID_TYPES: Tuple[ChordType, ...] = tuple(ChordType)
+_ID_KEYS: Tuple[ChordKey, ...] = tuple(k for k in ChordKey if k != ChordKey.N)
+_CHORD_IDS: Dict[Tuple[ChordKey, ChordType], int] = {(k, t): i for i, (t, k) in
+                                                     enumerate(product(_ID_TYPES, _ID_KEYS))}
+
+NO_CHORD_ID = len(_CHORD_IDS)
+CHORD_ID_DTYPE = np.min_scalar_type(NO_CHORD_ID)
+CHORDS: Tuple[IChord, ...] = tuple(chain((IChord(k, t) for t, k in product(_ID_TYPES, _ID_KEYS)),
+                                         (IChord(ChordKey.N, None),)))
+CHORD_LABELS: Tuple[str, ...] = tuple(map(repr, CHORDS))
+_LABEL_IDS: Dict[str, int] = {label: i for i, label in enumerate(CHORD_LABELS)}
+_LABELS = np.array(CHORD_LABELS)
+
+
+def chord_from_id(chord_id: int) -> IChord:
+    return CHORDS[chord_id]
+
+
+def label_to_id(label: str) -> int:
+    """ Unknown labels are no chord """
+    return _LABEL_IDS.get(label, NO_CHORD_ID)
+
+
+def labels_to_ids(labels: Iterable[str]) -> np.ndarray:
+    return np.fromiter((_LABEL_IDS.get(label, NO_CHORD_ID) for label in labels), dtype=CHORD_ID_DTYPE)
+
+
+def ids_to_labels(ids: np.ndarray) -> np.ndarray:
+    return _LABELS[ids]
+
+
+def ids_to_chords(ids: Iterable[int]) -> Tuple[IChord, ...]:
+    return tuple(CHORDS[i] for i in ids)
+
+
+@lru_cache(maxsize=None)
+def chords_to_ids(chords: Tuple[IChord, ...]) -> np.ndarray:
+    """ Read-only id of every chord, memoized for the banks and resolutions used over and over """
+    _ids = np.fromiter((chord.id for chord in chords), dtype=CHORD_ID_DTYPE, count=len(chords))
+    _ids.flags.writeable = False
+    return _ids
+
+
 class Chord(IChord, metaclass=ABCMeta):
 
     def __len__(self):
@@ -247,48 +354,65 @@ class Chord(IChord, metaclass=ABCMeta):
         pass
 
 
+def chord_template(chord_key: ChordKey, chord_type: ChordType) -> np.ndarray:
+    """ Pitch classes of the chord, the bass of an inversion weighs more """
+    if chord_type not in CHORD_INTERVALS:
+        raise IllegalStateError
+    _intervals = CHORD_INTERVALS[chord_type]
+    _template = np.zeros(VECTOR_SIZE, dtype=VECTOR_DTYPE)
+    _template[np.mod(_intervals, 12)] = 1
+    if _intervals[0] != 0:
+        _template[_intervals[0] % 12] = _BASS_WEIGHT
+    return np.roll(_template, chord_key.pos())
+
+
 class TemplateChord(Chord):
-    _MAJOR: Vector = (1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0)
-    _MINOR: Vector = (1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0)
-    _DIMINISHED: Vector = (1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0)
-    _AUGMENTED: Vector = (1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0)
 
     def shift(self):
-        for i, key in enumerate(ChordKey.__iter__()):
-            if key == self._chord_key:
-                return i
-        raise IllegalStateError
+        return self._chord_key.pos()
 
     @cached_property
     def vector(self) -> Vector:
-
-        _shift = self.shift()
-
-        if self.type == ChordType.MAJOR:
-            return _rotate_right(self._MAJOR, _shift)
-        if self.type == ChordType.MINOR:
-            return _rotate_right(self._MINOR, _shift)
-        if self.type == ChordType.DIMINISHED:
-            return _rotate_right(self._DIMINISHED, _shift)
-        if self.type == ChordType.AUGMENTED:
-            return _rotate_right(self._AUGMENTED, _shift)
-        raise IllegalStateError
+        return Vector(chord_template(self._chord_key, self._chord_type))
 
 
 class HarmonicChord(TemplateChord):
 
     @cached_property
     def vector(self) -> Vector:
+        return Vector(harmonic_templates()[self.id])
+
 
-        _result = ZeroVector()
-        for i, key in enumerate(super().vector):
-            if key:
-                _harm = _harmonics(tuple(ChordKey.__iter__())[i])
-                for _i, _key in enumerate(k for k in ChordKey.__iter__() if k != ChordKey.N):
-                    _count = _harm.count(_key)
-                    _result[_i] += sum(accumulate([.0125 for u in range(_count)], mul))
+_HARMONIC_WEIGHT = .0125
+HARMONIC_TEMPLATES_PATH = Path(__file__).parent / "data" / "harmonic_templates.npy"
 
-        return _result + super().vector
+
+def _harmonic_profile(start: int) -> np.ndarray:
+    """ Weight of every pitch class among the harmonics of `start`, the n-th hit of a class adds weight^n """
+    _count = np.bincount(_harmonic_pitches(start), minlength=12)
+    return np.array([sum(_HARMONIC_WEIGHT ** (j + 1) for j in range(c)) for c in _count])
+
+
+def compute_harmonic_templates() -> np.ndarray:
+    """ (chord ids, 12) harmonic templates of every chord, template notes plus the harmonics of every note """
+    _templates = np.stack([chord_template(k, t) for t, k in product(_ID_TYPES, _ID_KEYS)]).astype(np.float64)
+    _profiles = np.stack([_harmonic_profile(p) for p in range(12)])
+    _result = _templates + _templates.dot(_profiles)
+    return (_result / np.max(_result, axis=1, keepdims=True)).astype(VECTOR_DTYPE)
+
+
+@lru_cache(maxsize=None)
+def harmonic_templates() -> np.ndarray:
+    """ Read-only harmonic templates, loaded from the precomputed table when it is shipped and valid """
+    _templates = None
+    if HARMONIC_TEMPLATES_PATH.is_file():
+        _templates = np.load(HARMONIC_TEMPLATES_PATH, allow_pickle=False)
+        if _templates.shape != (NO_CHORD_ID, VECTOR_SIZE) or _templates.dtype != VECTOR_DTYPE:
+            _templates = None
+    if _templates is None:
+        _templates = compute_harmonic_templates()
+    _templates.flags.writeable = False
+    return _templates
 
 
 class Resolution(ABC):
@@ -300,6 +424,12 @@ class Resolution(ABC):
     def __reversed__(self):
         return reversed(tuple(self.__iter__()))
 
+    def __contains__(self, chord: IChord):
+        return chord in set(self.__iter__())
+
+    def ids(self) -> np.ndarray:
+        return chords_to_ids(tuple(self.__iter__()))
+
 
 class BasicResolution(Resolution):
 
@@ -307,7 +437,10 @@ class BasicResolution(Resolution):
         super().__init__()
 
     def __iter__(self):
-        return iter(IChord(k, t) for t, k in product(ChordType.__iter__(), ChordKey.__iter__()) if k != ChordKey.N)
+        return iter(IChord(k, t) for t, k in product(BASIC_TYPES, _ID_KEYS))
+
+    def __contains__(self, chord: IChord):
+        return chord._chord_type in BASIC_TYPES and chord._chord_key != ChordKey.N
 
 
 class StrictResolution(Resolution):
@@ -319,18 +452,36 @@ class StrictResolution(Resolution):
     def __iter__(self):
         return iter(self._chords)
 
+    def __contains__(self, chord: IChord):
+        return chord in self._chords
+
+
+class _ChordBank(object):
+    """ Chords of the given types in every key, built on first access and kept for the process """
+
+    def __init__(self, chord_class, *chord_types: ChordType) -> None:
+        super().__init__()
+        self._chord_class = chord_class
+        self._chord_types = chord_types
+        self._chords = None
+
+    def __get__(self, instance, owner) -> Tuple[Chord, ...]:
+        if self._chords is None:
+            self._chords = tuple(self._chord_class(k, t) for t, k in product(self._chord_types, _ID_KEYS))
+        return self._chords
+
 
 class TemplateChords(object):
-    MAJOR = tuple(TemplateChord(key, ChordType.MAJOR) for key in ChordKey if key != ChordKey.N)
-    MINOR = tuple(TemplateChord(key, ChordType.MINOR) for key in ChordKey if key != ChordKey.N)
-    AUGMENTED = tuple(TemplateChord(key, ChordType.AUGMENTED) for key in ChordKey if key != ChordKey.N)
-    DIMINISHED = tuple(TemplateChord(key, ChordType.DIMINISHED) for key in ChordKey if key != ChordKey.N)
-    ALL = tuple(chain(MAJOR, MINOR, AUGMENTED, DIMINISHED))
+    MAJOR = _ChordBank(TemplateChord, ChordType.MAJOR)
+    MINOR = _ChordBank(TemplateChord, ChordType.MINOR)
+    AUGMENTED = _ChordBank(TemplateChord, ChordType.AUGMENTED)
+    DIMINISHED = _ChordBank(TemplateChord, ChordType.DIMINISHED)
+    ALL = _ChordBank(TemplateChord, ChordType.MAJOR, ChordType.MINOR, ChordType.AUGMENTED, ChordType.DIMINISHED)
 
 
 class HarmonicChords(object):
-    MAJOR = tuple(HarmonicChord(key, ChordType.MAJOR) for key in ChordKey if key != ChordKey.N)
-    MINOR = tuple(HarmonicChord(key, ChordType.MINOR) for key in ChordKey if key != ChordKey.N)
-    AUGMENTED = tuple(HarmonicChord(key, ChordType.AUGMENTED) for key in ChordKey if key != ChordKey.N)
-    DIMINISHED = tuple(HarmonicChord(key, ChordType.DIMINISHED) for key in ChordKey if key != ChordKey.N)
-    ALL = tuple(chain(MAJOR, MINOR, AUGMENTED, DIMINISHED))
+    MAJOR = _ChordBank(HarmonicChord, ChordType.MAJOR)
+    MINOR = _ChordBank(HarmonicChord, ChordType.MINOR)
+    AUGMENTED = _ChordBank(HarmonicChord, ChordType.AUGMENTED)
+    DIMINISHED = _ChordBank(HarmonicChord, ChordType.DIMINISHED)
+    ALL = _ChordBank(HarmonicChord, ChordType.MAJOR, ChordType.MINOR, ChordType.AUGMENTED, ChordType.DIMINISHED)
@@ -0,0 +1,86 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+from pathlib import Path
+from typing import Tuple, Union
+
+import numpy as np
+
+from .annotation import ChordTimeline, make_timeline
+from .exceptions import IllegalArgumentError
+from .music import IChord, CHORD_ID_DTYPE, ids_to_chords
+
+SCORE_DTYPE = np.float32
+
+
+class RecognitionResult(object):
+    """ Chord ids of the recognized frames with the (frames, vocabulary) scores they were chosen from. Column j of
+    the scores belongs to the chord `vocabulary[j]`, `times` are the frame boundaries in seconds when known. Arrays
+    already of the right type and layout are kept without copying. """
+
+    _FILES = ("ids", "scores", "vocabulary", "times")
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, vocabulary: np.ndarray, times: np.ndarray = None) -> None:
+        super().__init__()
+
+        if ids.ndim != 1 or scores.shape != (len(ids), len(vocabulary)):
+            raise IllegalArgumentError
+        if times is not None and len(times) != len(ids) + 1:
+            raise IllegalArgumentError
+
+        self.ids = np.asarray(ids, dtype=CHORD_ID_DTYPE)
+        self.scores = np.asarray(scores, dtype=SCORE_DTYPE)
+        self.vocabulary = np.asarray(vocabulary, dtype=CHORD_ID_DTYPE)
+        self.times = times
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def chords(self) -> Tuple[IChord, ...]:
+        return ids_to_chords(self.ids)
+
+    def timeline(self) -> ChordTimeline:
+        if self.times is None:
+            raise IllegalArgumentError("Result without times")
+        return make_timeline(self.times, self.ids)
+
+    def save(self, directory: Union[Path, str]):
+        """ One .npy file per array, loadable without chordify or memory mapped by `load` """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self._FILES:
+            value = getattr(self, name)
+            if value is not None:
+                np.save(directory / (name + ".npy"), np.ascontiguousarray(value), allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory: Union[Path, str], mmap_mode: str = "r") -> 'RecognitionResult':
+        directory = Path(directory)
+        _arrays = {name: np.load(directory / (name + ".npy"), mmap_mode=mmap_mode, allow_pickle=False)
+                   for name in cls._FILES if (directory / (name + ".npy")).is_file()}
+        return RecognitionResult(_arrays["ids"], _arrays["scores"], _arrays["vocabulary"], _arrays.get("times"))
@@ -32,7 +32,7 @@ from pathlib import Path
 from typing import Tuple
 
 from .annotation import ChordTimeline
-from .music import IChord, ChordKey
+from .music import IChord, NO_CHORD_ID
 
 
 class SupervisedDirectoryAdapter(object):
@@ -69,11 +69,13 @@ def score(prediction: ChordTimeline, annotation: ChordTimeline) -> float:
     _skip = 0
     _i_annotation = 0
     _i_prediction = 0
+    _a_start, _a_stop, _a_ids = annotation.start(), annotation.stop(), annotation.chord_ids().tolist()
+    _p_start, _p_stop, _p_ids = prediction.start(), prediction.stop(), prediction.chord_ids().tolist()
     while _i_annotation < len(annotation) and _i_prediction < len(prediction):
-        start, stop, chord = annotation[_i_annotation]
-        p_start, p_stop, p_chord = prediction[_i_prediction]
+        start, stop, chord = _a_start[_i_annotation], _a_stop[_i_annotation], _a_ids[_i_annotation]
+        p_start, p_stop, p_chord = _p_start[_i_prediction], _p_stop[_i_prediction], _p_ids[_i_prediction]
 
-        if chord == IChord(ChordKey.N, None):
+        if chord == NO_CHORD_ID:
             _i_annotation += 1
             _skip += 1
             continue
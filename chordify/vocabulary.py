@@ -0,0 +1,163 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+from functools import lru_cache
+from typing import Dict, Sequence, Tuple, Union
+
+import numpy as np
+
+from .exceptions import IllegalArgumentError
+from .music import ChordType, IChord, Resolution, BASIC_TYPES, NO_CHORD_ID, CHORD_ID_DTYPE, VECTOR_SIZE, \
+    chord_template, ids_to_chords, harmonic_templates
+
+
+class Vocabulary(Resolution):
+    """ Chords of the given types in every key, ordered type by type like the chord ids """
+
+    def __init__(self, name: str, chord_types: Sequence[ChordType]) -> None:
+        super().__init__()
+
+        if len(chord_types) == 0 or len(set(chord_types)) != len(chord_types):
+            raise IllegalArgumentError
+
+        self.name = name
+        self.chord_types = tuple(chord_types)
+
+        _types = tuple(ChordType)
+        self._ids = np.array([_types.index(t) * 12 + k for t in self.chord_types for k in range(12)],
+                             dtype=CHORD_ID_DTYPE)
+        self._ids.flags.writeable = False
+        self._mask = np.zeros(NO_CHORD_ID + 1, dtype=bool)
+        self._mask[self._ids] = True
+        self.chords: Tuple[IChord, ...] = ids_to_chords(self._ids)
+
+    def __iter__(self):
+        return iter(self.chords)
+
+    def __len__(self):
+        return len(self.chords)
+
+    def __contains__(self, chord: IChord):
+        return bool(self._mask[chord.id])
+
+    def __repr__(self):
+        return "Vocabulary(%r, %d chords)" % (self.name, len(self))
+
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+
+# "full" adds inversions, their templates differ from root position only by a heavier bass pitch class, which
+# pitch class chroma does not measure, so they are an opt-in
+VOCABULARIES: Dict[str, Vocabulary] = {v.name: v for v in (
+    Vocabulary("basic", BASIC_TYPES),
+    Vocabulary("sevenths", BASIC_TYPES + (ChordType.DOMINANT7, ChordType.MAJOR7, ChordType.MINOR7,
+                                          ChordType.DIMINISHED7, ChordType.HALF_DIMINISHED7, ChordType.MINOR_MAJOR7)),
+    Vocabulary("full", tuple(ChordType)),
+)}
+
+
+def get_vocabulary(vocabulary: Union[str, Vocabulary]) -> Vocabulary:
+    if isinstance(vocabulary, Vocabulary):
+        return vocabulary
+    try:
+        return VOCABULARIES[vocabulary]
+    except KeyError:
+        raise IllegalArgumentError("Unknown vocabulary %r" % vocabulary)
+
+
+# up to this many candidates are selected by repeated argmax instead of a partition
+_TOP_K_SELECT = 8
+
+
+class TemplateBank(object):
+    """ Templates of a vocabulary as the L2 normalized rows of one dense matrix, all frames are scored against all
+    chords in one product """
+
+    def __init__(self, vocabulary: Vocabulary, harmonics: bool = False) -> None:
+        super().__init__()
+
+        self.vocabulary = vocabulary
+        self.harmonics = harmonics
+
+        if harmonics:
+            _matrix = np.array(harmonic_templates()[vocabulary.ids()])
+        else:
+            _matrix = np.stack([chord_template(chord._chord_key, chord._chord_type) for chord in vocabulary])
+        _matrix /= np.linalg.norm(_matrix, axis=1, keepdims=True)
+        _matrix.flags.writeable = False
+        self.matrix = _matrix
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.vocabulary.ids()
+
+    def scores(self, chroma: np.ndarray) -> np.ndarray:
+        """ (chords, frames) cosine similarity up to the norm of each frame. The product is computed frame-major, so
+        reductions over the chords of a frame run over contiguous memory. """
+        if chroma.shape[0] != VECTOR_SIZE:
+            raise IllegalArgumentError
+        return chroma.T.dot(self.matrix.T).T
+
+    def best(self, chroma: np.ndarray) -> np.ndarray:
+        """ Index into the vocabulary of the best chord of every frame """
+        return np.argmax(self.scores(chroma), axis=0)
+
+    def top_k(self, chroma: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ Indices into the vocabulary of the k best chords of every frame and their scores, both (k, frames) and
+        best first """
+        if k <= 0:
+            raise IllegalArgumentError
+        k = min(k, len(self))
+        _scores = self.scores(chroma).T
+        _frames = np.arange(_scores.shape[0])
+
+        if k <= _TOP_K_SELECT:
+            # a few passes of argmax come out ordered, with ties in the vocabulary order, and beat a partition
+            _scores = _scores.copy()
+            _top = np.empty((_scores.shape[0], k), dtype=np.intp)
+            _top_scores = np.empty((_scores.shape[0], k), dtype=_scores.dtype)
+            for i in range(k):
+                _top[:, i] = np.argmax(_scores, axis=1)
+                _top_scores[:, i] = _scores[_frames, _top[:, i]]
+                _scores[_frames, _top[:, i]] = -np.inf
+            return _top.T, _top_scores.T
+
+        _top = np.argpartition(-_scores, k - 1, axis=1)[:, :k]
+        _top_scores = np.take_along_axis(_scores, _top, axis=1)
+        # equal scores, such as of the enharmonic diminished sevenths, keep the vocabulary order like argmax
+        _order = np.lexsort((_top, -_top_scores), axis=1)
+        return np.take_along_axis(_top, _order, axis=1).T, np.take_along_axis(_top_scores, _order, axis=1).T
+
+
+@lru_cache(maxsize=None)
+def template_bank(vocabulary: Union[str, Vocabulary], harmonics: bool = False) -> TemplateBank:
+    """ Template bank of the vocabulary, built once per process """
+    return TemplateBank(get_vocabulary(vocabulary), harmonics)
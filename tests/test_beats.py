@@ -0,0 +1,70 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import librosa
+import numpy as np
+import pytest
+import soundfile
+
+from chordify.audio_processing import AnalysisContext, BeatSegmentationStrategy, PathLoadStrategy
+
+SR = 44100
+HOP_LENGTH = 4096
+
+
+def struck_chords(noise: float, seconds: float = 20.0, bpm: float = 120.0) -> np.ndarray:
+    """ Decaying triads of C, A:min, F and G, one on every beat, over white noise """
+    rng = np.random.RandomState(0)
+    t = np.arange(int(seconds * SR)) / SR
+    y = noise * rng.randn(len(t))
+    chords = ((261.63, 329.63, 392.0), (220.0, 261.63, 329.63), (174.61, 220.0, 261.63), (196.0, 246.94, 293.66))
+    for k, onset in enumerate(np.arange(0, seconds, 60.0 / bpm)):
+        _t = t[t >= onset] - onset
+        for f in chords[k % len(chords)]:
+            y[t >= onset] += 0.2 * np.exp(-3 * _t) * np.sin(2 * np.pi * f * _t)
+    return y.astype(np.float32)
+
+
+@pytest.mark.parametrize("noise", [0.0, 0.01, 0.05])
+def test_beats_equal_beat_track(tmp_path, noise):
+    path = tmp_path / "chords.wav"
+    soundfile.write(str(path), struck_chords(noise), SR)
+
+    # the load strategy leaves its harmonic separation in the analysis context, the beats must not depend on it
+    analysis = AnalysisContext(path)
+    y_harm = PathLoadStrategy(SR).run(path, analysis)
+    chroma = np.zeros((12, 1 + len(y_harm) // HOP_LENGTH), dtype=np.float32)
+
+    _, expected = librosa.beat.beat_track(y=y_harm, sr=SR, hop_length=HOP_LENGTH, trim=False)
+    expected = librosa.frames_to_time(librosa.util.fix_frames(expected, x_max=chroma.shape[1]), sr=SR,
+                                      hop_length=HOP_LENGTH)
+
+    strategy = BeatSegmentationStrategy(SR, HOP_LENGTH)
+    for _analysis in (analysis, analysis, None):
+        _, beat_t = strategy.run(y_harm, chroma, _analysis)
+        np.testing.assert_array_equal(beat_t, expected)
+    assert ("onset_envelope", SR, 2048, HOP_LENGTH) in analysis
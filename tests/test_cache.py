@@ -0,0 +1,56 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import numpy as np
+import pytest
+
+from chordify import cache
+from chordify.cache import MemoryCache, file_digest
+
+
+def test_memory_cache_values_are_read_only():
+    memory = MemoryCache(1 << 20)
+    memory.put("chroma", np.ones((12, 4)))
+    memory.put("segments", (np.ones((12, 2)), np.arange(3.0), None))
+
+    with pytest.raises(ValueError):
+        memory.get("chroma")[0, 0] = 0
+    with pytest.raises(ValueError):
+        memory.get("segments")[1][0] = 1
+    assert memory.get("chroma").sum() == 48
+
+
+def test_digests_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "_DIGESTS_MAX", 2)
+    monkeypatch.setattr(cache, "_digests", type(cache._digests)())
+    paths = [tmp_path / ("%d.wav" % i) for i in range(3)]
+    for i, path in enumerate(paths):
+        path.write_bytes(bytes([i]))
+        file_digest(path)
+
+    assert len(cache._digests) == 2
+    assert cache.file_stat_key(paths[0]) not in cache._digests
@@ -0,0 +1,70 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from chordify.checkpoint import CheckpointStore
+
+_KILLED_RUN = """
+import os, signal, sys
+import numpy as np
+from chordify.checkpoint import CheckpointStore
+
+store = CheckpointStore(sys.argv[1], "key", shard_size=4)
+for i in range(6):
+    store.put("digest-%d" % i, "track-%d.wav" % i, np.full(12, i / 7, dtype=np.float32))
+store.fail("digest-6", "track-6.wav", ValueError("corrupt"))
+os.kill(os.getpid(), signal.SIGKILL)
+"""
+
+
+def test_killed_run_resumes(tmp_path):
+    run = subprocess.run([sys.executable, "-c", _KILLED_RUN, str(tmp_path)], cwd=str(Path(__file__).parents[1]))
+    assert run.returncode != 0
+
+    store = CheckpointStore(tmp_path, "key", shard_size=4)
+    assert len(store) == 6
+    for i in range(6):
+        assert np.array_equal(store.get("digest-%d" % i), np.full(12, i / 7, dtype=np.float32))
+    assert "digest-6" in store.failures
+
+    store.put("digest-6", "track-6.wav", np.ones(12))
+    store.close()
+    store = CheckpointStore(tmp_path, "key", shard_size=4)
+    assert len(store) == 7 and not store.failures
+    assert np.array_equal(store.get("digest-5"), np.full(12, 5 / 7, dtype=np.float32))
+    assert np.array_equal(store.get("digest-6"), np.ones(12))
+
+
+def test_other_key_is_ignored(tmp_path):
+    with CheckpointStore(tmp_path, "key") as store:
+        store.put("digest", "track.wav", np.ones(12))
+    assert len(CheckpointStore(tmp_path, "other")) == 0
@@ -0,0 +1,85 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import librosa
+import numpy as np
+import pytest
+import soundfile
+
+from chordify.app import Chordify
+from chordify.audio_processing import AudioProcessing, AnalysisContext, HCDFSegmentationStrategy
+from chordify.chord_recognition import TemplatePredictStrategy
+
+SR = 22050
+
+
+@pytest.fixture
+def track(tmp_path):
+    t = np.arange(4 * SR) / SR
+    y = sum(0.2 * np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0))
+    y += 0.01 * np.random.RandomState(0).randn(len(t))
+    path = tmp_path / "chord.wav"
+    soundfile.write(str(path), y, SR)
+    return path
+
+
+@pytest.fixture
+def config():
+    return dict(Chordify.default_config, DTYPE="float32", SAMPLING_FREQUENCY=SR, HOP_LENGTH=2048,
+                AP_BEAT_STRATEGY_CLASS=HCDFSegmentationStrategy)
+
+
+def test_stages_keep_float32(track, config, monkeypatch):
+    _cqt_dtypes = list()
+    _cqt = librosa.cqt
+
+    def cqt(*args, **kwargs):
+        c = _cqt(*args, **kwargs)
+        _cqt_dtypes.append(c.dtype)
+        return c
+
+    monkeypatch.setattr(librosa, "cqt", cqt)
+
+    processing = AudioProcessing.factory(config)
+    analysis = AnalysisContext(track)
+
+    y = processing.load_strategy.run(track, analysis)
+    assert y.dtype == np.float32
+    assert analysis.get(("harmonic_stft", SR, 2048)).dtype == np.complex64
+
+    c = processing.stft_strategy.run(y, analysis)
+    assert _cqt_dtypes == [np.complex64]
+    assert c.dtype == np.float32
+
+    chroma = processing.chroma_strategy.run(c, analysis)
+    assert chroma.dtype == np.float32
+
+    vectors, _ = processing.process(track)
+    assert vectors.dtype == np.float32
+
+    scores = TemplatePredictStrategy.factory(config).scores(vectors)
+    assert scores.dtype == np.float32
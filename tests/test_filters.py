@@ -0,0 +1,85 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import subprocess
+import sys
+from pathlib import Path
+
+import librosa
+import numpy as np
+import pytest
+import soundfile
+
+from chordify.audio_processing import hpss, local_nn_filter, nn_filter
+from chordify.exceptions import IllegalArgumentError
+
+SR = 22050
+
+
+def chords(seconds=8):
+    t = np.arange(seconds * SR) / SR
+    y = np.zeros_like(t)
+    for i, triad in enumerate(((261.63, 329.63, 392.0), (220.0, 261.63, 329.63))):
+        part = slice(i * seconds * SR // 2, (i + 1) * seconds * SR // 2)
+        y[part] = sum(0.2 * np.sin(2 * np.pi * f * t[part]) for f in triad)
+    return (y + 0.05 * np.random.RandomState(0).randn(len(t))).astype(np.float32)
+
+
+@pytest.mark.parametrize("margin", [1.0, 8.0])
+def test_hpss_equals_librosa(margin):
+    s = librosa.stft(chords())
+    for expected, actual in zip(librosa.decompose.hpss(s, margin=margin), hpss(s, margin=margin)):
+        assert actual.dtype == expected.dtype
+        assert np.array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("block", [1024, 7])
+def test_nn_filter_equals_librosa(block):
+    chroma = librosa.feature.chroma_stft(y=chords(), sr=SR)
+    # silent frames are at the same distance from all others
+    chroma[:, :20] = 0
+    expected = librosa.decompose.nn_filter(chroma, aggregate=np.median, metric="cosine")
+    assert np.array_equal(nn_filter(chroma, block), expected)
+
+
+@pytest.mark.parametrize("window, k", [(0, None), (-3, None), (4, 0), (4, -1)])
+def test_local_nn_filter_rejects_empty_neighbourhoods(window, k):
+    with pytest.raises(IllegalArgumentError):
+        local_nn_filter(np.ones((12, 10)), window, k)
+
+
+def test_prediction_does_not_import_sklearn(tmp_path):
+    path = tmp_path / "chords.wav"
+    soundfile.write(str(path), chords(), SR)
+    code = ("import sys\n"
+            "from chordify.app import Chordify\n"
+            "with Chordify().with_config({'CHARTS': False}) as app:\n"
+            "    app.recognize(%r)\n"
+            "print(sorted(m for m in ('sklearn', 'pandas') if m in sys.modules))" % str(path))
+    out = subprocess.run([sys.executable, "-c", code], cwd=str(Path(__file__).parents[1]), check=True,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    assert out.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,50 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import numpy as np
+import pytest
+
+from chordify.app import Chordify
+from chordify.learn import SVCLearn, SupervisedVectors
+from chordify.model import load_model
+from chordify.music import harmonic_templates
+from chordify.state import AppState
+
+
+@pytest.mark.parametrize("search", ["grid", "halving"])
+def test_svc_search_fits(tmp_path, search):
+    rng = np.random.RandomState(0)
+    ids = rng.choice(np.array([0, 7, 21, 5]), 200)
+    vectors = SupervisedVectors()
+    vectors.extend(harmonic_templates()[ids] + 0.3 * rng.rand(len(ids), 12), ids)
+    config = dict(Chordify.default_config, SVC_SEARCH=search, SVC_PARAM_GRID={"C": [1, 10], "gamma": ["scale"]},
+                  CPU_BUDGET=1)
+
+    SVCLearn.factory(config, AppState.LEARNING, open(str(tmp_path / "model.pickle"), "wb")).learn(vectors)
+
+    model = load_model(str(tmp_path / "model.pickle"), config)
+    assert np.mean(model.predict_ids(vectors.vectors().T) == ids) > 0.9
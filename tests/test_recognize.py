@@ -0,0 +1,90 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+import os
+
+import librosa
+import numpy as np
+import pytest
+import soundfile
+
+from chordify.app import Chordify
+from chordify.audio_processing import AudioProcessing, BeatSegmentationStrategy, HCDFSegmentationStrategy
+
+SR = 22050
+
+
+@pytest.fixture
+def track(tmp_path):
+    t = np.arange(8 * SR) / SR
+    y = np.zeros_like(t)
+    for i, triad in enumerate(((261.63, 329.63, 392.0), (220.0, 261.63, 329.63))):
+        part = slice(i * 4 * SR, (i + 1) * 4 * SR)
+        y[part] = sum(0.2 * np.sin(2 * np.pi * f * t[part]) for f in triad)
+    y += 0.05 * np.random.RandomState(0).randn(len(t))
+    path = tmp_path / "chords.wav"
+    soundfile.write(str(path), y, SR)
+    return path
+
+
+@pytest.mark.parametrize("segmentation", [BeatSegmentationStrategy, HCDFSegmentationStrategy])
+def test_recognize_spans_the_track(track, segmentation):
+    with Chordify().with_config({"SAMPLING_FREQUENCY": SR, "AP_BEAT_STRATEGY_CLASS": segmentation}) as app:
+        result = app.recognize(track)
+
+    assert len(result.times) == len(result) + 1
+    assert result.times[0] == 0
+    assert result.times[-1] == pytest.approx(8, abs=0.2)
+    assert np.all(np.diff(result.times) >= 0)
+    assert len(result.timeline()) == len(result)
+
+
+def test_process_reuses_the_analysis_of_the_file(track, monkeypatch):
+    calls = {"load": 0, "cqt": 0}
+    for name in calls:
+        def counted(*args, _name=name, _func=getattr(librosa, name), **kwargs):
+            calls[_name] += 1
+            return _func(*args, **kwargs)
+        monkeypatch.setattr(librosa, name, counted)
+    processing = AudioProcessing.factory(dict(Chordify.default_config, SAMPLING_FREQUENCY=SR, CACHE_MAX_BYTES=0))
+
+    first = processing.process(track)
+    assert processing.process(track)[0].tolist() == first[0].tolist()
+    assert calls == {"load": 1, "cqt": 1}
+
+    os.utime(str(track), ns=(0, 0))
+    processing.process(track)
+    assert calls == {"load": 2, "cqt": 2}
+
+
+def test_process_without_cache_does_not_hash(track, monkeypatch):
+    def file_digest(path):
+        raise AssertionError("hashed " + str(path))
+    monkeypatch.setattr("chordify.audio_processing.file_digest", file_digest)
+    processing = AudioProcessing.factory(dict(Chordify.default_config, SAMPLING_FREQUENCY=SR, CACHE_MAX_BYTES=0))
+
+    processing.process(track)
@@ -0,0 +1,65 @@
+#  Copyright 2020 Matúš Škerlík
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or
+#  substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+#  PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+#  LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT
+#  OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify, merge,
+#  publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons
+#  to whom the Software is furnished to do so, subject to the following conditions:
+#
+#
+"""
+Regenerates the precomputed harmonic templates shipped in chordify/data, the output is byte for byte reproducible.
+
+    PYTHONPATH=. python tools/harmonic_templates.py [--check]
+"""
+import sys
+from argparse import ArgumentParser
+from io import BytesIO
+
+import numpy as np
+
+from chordify.music import compute_harmonic_templates, HARMONIC_TEMPLATES_PATH
+
+
+def serialize(templates: np.ndarray) -> bytes:
+    _buffer = BytesIO()
+    np.save(_buffer, np.ascontiguousarray(templates, dtype="<f4"), allow_pickle=False)
+    return _buffer.getvalue()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--check", action="store_true", help="only compare the shipped table with a fresh one")
+    args = parser.parse_args()
+
+    _table = serialize(compute_harmonic_templates())
+    if args.check:
+        _current = HARMONIC_TEMPLATES_PATH.read_bytes() if HARMONIC_TEMPLATES_PATH.is_file() else None
+        print("up to date" if _current == _table else "outdated: " + str(HARMONIC_TEMPLATES_PATH))
+        sys.exit(0 if _current == _table else 1)
+
+    HARMONIC_TEMPLATES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    HARMONIC_TEMPLATES_PATH.write_bytes(_table)
+    print("written: " + str(HARMONIC_TEMPLATES_PATH))
+
+
+if __name__ == '__main__':
+    main()